@@ -0,0 +1,107 @@
+"""
+Synthetic data for the benchmarks: group chats with message streams,
+moderators and ignored users. Always run against a throwaway database.
+"""
+import random
+
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from cfg.config import settings
+from repositories.indexes import REPOSITORIES, ensure_indexes
+from repositories.mongodb import (
+    ChatRepository, MessageRepository, ChatStateRepository,
+    UserRepository, IgnoredUserRepository
+)
+from schemas.records import MessageRecord
+
+
+TEXTS = [
+    "hello", "any update?", "please check the deal", "when will it be ready?",
+    "thanks", "noted", "ok", "let me check", "done", "push",
+]
+
+
+class Dataset:
+    def __init__(self, chat_ids: List[int], moderators: List[str], ignored_users: List[str], seed: int) -> None:
+        self.chat_ids = chat_ids
+        self.moderators = moderators
+        self.ignored_users = ignored_users
+        self.random = random.Random(seed)
+
+    def chat_name(self, chat_id: int) -> str:
+        return f"Group {abs(chat_id) % 1000000}"
+
+    def random_message(self, chat_id: int, created_at: datetime) -> MessageRecord:
+        roll = self.random.random()
+        if roll < 0.25:
+            username = self.random.choice(self.moderators)
+        elif roll < 0.30:
+            username = self.random.choice(self.ignored_users)
+        else:
+            username = f"advertiser{abs(chat_id) % 1000000}_{self.random.randint(0, 2)}"
+
+        return MessageRecord(
+            chat_id=chat_id, name=self.chat_name(chat_id),
+            message=self.random.choice(TEXTS), username=username,
+            created_at=created_at, first_name="First", last_name="Last",
+        )
+
+    def message_stream(self, count: int) -> Iterator[MessageRecord]:
+        """ Live traffic: `count` new messages spread over random chats """
+        for _ in range(count):
+            yield self.random_message(self.random.choice(self.chat_ids), datetime.now())
+
+
+def check_database() -> None:
+    if settings.MONGO_DB_NAME == "DB":
+        raise SystemExit("Refusing to run against the production database, set MONGO_DB_NAME")
+
+
+def generate_dataset(
+        chats: int,
+        messages_per_chat: int,
+        moderators: int = 10,
+        ignored_users: int = 20,
+        seed: int = 0,
+) -> Dataset:
+    """ Drop all collections and fill them with 48 hours of traffic """
+    check_database()
+    for repository in REPOSITORIES:
+        repository.db.drop()
+    ensure_indexes()
+
+    dataset = Dataset(
+        chat_ids=[-1000000000000 - i for i in range(chats)],
+        moderators=[f"moderator{i}" for i in range(moderators)],
+        ignored_users=[f"ignored{i}" for i in range(ignored_users)],
+        seed=seed,
+    )
+
+    UserRepository.db.insert_many([
+        {"username": username, "chat_id": i + 1, "is_moderator": True, "receive_notifications": True}
+        for i, username in enumerate(dataset.moderators)
+    ])
+    IgnoredUserRepository.db.insert_many([{"username": username} for username in dataset.ignored_users])
+
+    now = datetime.now()
+    ChatRepository.db.insert_many([
+        {"chat_id": chat_id, "name": dataset.chat_name(chat_id), "created_at": now - timedelta(days=30)}
+        for chat_id in dataset.chat_ids
+    ])
+
+    batch = []
+    for chat_id in dataset.chat_ids:
+        for _ in range(messages_per_chat):
+            created_at = now - timedelta(minutes=dataset.random.randint(0, 48 * 60))
+            batch.append(dataset.random_message(chat_id, created_at).to_document())
+        if len(batch) >= 10000:
+            MessageRepository.db.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        MessageRepository.db.insert_many(batch, ordered=False)
+
+    for start in range(0, chats, 500):
+        ChatStateRepository.rebuild(dataset.chat_ids[start:start + 500])
+
+    return dataset
@@ -0,0 +1,64 @@
+"""
+Compare the strategies of MessageRepository.get_last_messages_for_today
+on a synthetic dataset. Needs a local mongod and a throwaway database:
+
+    DATABASE_URL=mongodb://localhost:27017/ MONGO_DB_NAME=bench \
+        python -m benchmarks.last_messages --chats 5000 --messages 20
+"""
+import argparse
+import time
+
+from typing import Callable, Dict, List
+
+from benchmarks.generator import check_database, generate_dataset
+from repositories.mongodb import MessageRepository, ChatStateRepository
+from schemas.records import MessageRecord
+
+
+def measure(func: Callable[[], List[MessageRecord]], repeat: int) -> Dict:
+    timings = []
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "min_ms": round(timings[0] * 1000, 2),
+        "median_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "chats": len(result),
+        "chat_ids": {msg.chat_id for msg in result},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark last-message strategies")
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20, help="messages per chat")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-generate", action="store_true")
+    args = parser.parse_args()
+
+    check_database()
+    if not args.skip_generate:
+        generate_dataset(args.chats, args.messages)
+
+    strategies = {
+        "loop": MessageRepository.get_last_message_from_all_group_chats_for_today,
+        "aggregate": MessageRepository.get_last_message_from_all_group_chats_for_today_aggregated,
+        "chat_state": ChatStateRepository.get_last_messages_for_today,
+    }
+    results = {name: measure(func, args.repeat) for name, func in strategies.items()}
+
+    print(f"{'strategy':<12}{'min ms':>10}{'median ms':>12}{'chats':>8}")
+    for name, res in results.items():
+        print(f"{name:<12}{res['min_ms']:>10}{res['median_ms']:>12}{res['chats']:>8}")
+
+    expected = results["loop"]["chat_ids"]
+    for name, res in results.items():
+        if res["chat_ids"] != expected:
+            print(f"WARNING: {name} returned a different set of chats than loop")
+
+
+if __name__ == '__main__':
+    main()
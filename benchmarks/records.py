@@ -0,0 +1,60 @@
+"""
+Per-message CPU time and allocations of MessageSchema (pydantic) versus
+MessageRecord (slotted) on the ingest and checker paths. No database needed.
+
+    python -m benchmarks.records --count 100000
+"""
+import argparse
+import time
+import tracemalloc
+
+from datetime import datetime
+from typing import Callable, Dict
+
+from schemas.messages import MessageSchema
+from schemas.records import MessageRecord
+
+
+FIELDS = dict(
+    chat_id=-1001234567890, name="Some group", message="hello there",
+    username="advertiser", created_at=datetime.now(),
+    first_name="First", last_name="Last",
+)
+
+
+def measure(func: Callable[[], object], count: int) -> Dict:
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    cpu_us = (time.perf_counter() - started) / count * 1_000_000
+
+    # Keep the results alive to see what they cost in memory
+    tracemalloc.start()
+    results = [func() for _ in range(count)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return {"us_per_msg": round(cpu_us, 3), "bytes_per_msg": round(current / count, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark message records")
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    document = MessageRecord(**FIELDS).to_document()
+    cases = {
+        "ingest schema  (build + model_dump)": lambda: MessageSchema(**FIELDS).model_dump(),
+        "ingest record  (build + to_document)": lambda: MessageRecord(**FIELDS).to_document(),
+        "read schema    (MessageSchema(**doc))": lambda: MessageSchema(**document),
+        "read record    (from_document)": lambda: MessageRecord.from_document(document),
+    }
+
+    print(f"{'case':<40}{'us/msg':>10}{'bytes/msg':>12}")
+    for name, func in cases.items():
+        res = measure(func, args.count)
+        print(f"{name:<40}{res['us_per_msg']:>10}{res['bytes_per_msg']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark suite: ingest throughput, checker wall time, Mongo commands
+issued and peak memory at several scales. Needs a local mongod and a
+throwaway database. Results are printed and written as JSON, so runs of
+different versions can be compared.
+
+    DATABASE_URL=mongodb://localhost:27017/ MONGO_DB_NAME=bench \
+        python -m benchmarks.suite --scales 10,100,1000,5000 --output bench.json
+"""
+from collections import Counter
+
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """ Counts the commands sent to mongod, by command name """
+
+    def __init__(self) -> None:
+        self.counts = Counter()
+
+    def reset(self) -> None:
+        self.counts = Counter()
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def started(self, event) -> None:
+        self.counts[event.command_name] += 1
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+# Listeners must be registered before the MongoClient is created on import
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import subprocess  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+
+from datetime import datetime, timedelta  # noqa: E402
+from typing import Callable, Dict, List  # noqa: E402
+
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+from benchmarks.generator import Dataset, check_database, generate_dataset  # noqa: E402
+from cfg.cache import redis_client  # noqa: E402
+from repositories.hot_state import HotStateRepository  # noqa: E402
+from repositories.mongodb import MessageRepository, ChatStateRepository  # noqa: E402
+from services.reference_data import ReferenceData  # noqa: E402
+from services.rules import compile_rules, default_rules, find_waiting_advertisers  # noqa: E402
+
+
+STRATEGIES: Dict[str, Callable] = {
+    "loop": MessageRepository.get_last_message_from_all_group_chats_for_today,
+    "aggregate": MessageRepository.get_last_message_from_all_group_chats_for_today_aggregated,
+    "chat_state": ChatStateRepository.get_last_messages_for_today,
+}
+
+
+def bench_ingest(dataset: Dataset, count: int, batch_size: int) -> Dict:
+    """ Write messages and chat states in batches, like the write-behind queue """
+    stream = list(dataset.message_stream(count))
+    command_counter.reset()
+    started = time.perf_counter()
+    for start in range(0, len(stream), batch_size):
+        batch = stream[start:start + batch_size]
+        MessageRepository.db.bulk_write([MessageRepository.create_msg_op(msg) for msg in batch], ordered=False)
+        try:
+            ChatStateRepository.db.bulk_write(
+                [ChatStateRepository.upsert_state_op(msg) for msg in batch], ordered=False
+            )
+        except BulkWriteError:  # stale states, expected
+            pass
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": count,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(count / elapsed, 1),
+        "commands": command_counter.total,
+    }
+
+
+def bench_checker(dataset: Dataset, strategy: str, repeat: int) -> Dict:
+    """ One shard-less check: read the last messages and evaluate the rules """
+    ref = ReferenceData(
+        moderators=frozenset(dataset.moderators),
+        ignored_users=frozenset(dataset.ignored_users),
+        admins_chat_id=0,
+        rules=compile_rules(default_rules()),
+        loaded_at=time.monotonic(),
+    )
+    timings: List[float] = []
+    advertisers: List[Dict] = []
+    commands = 0
+    peak = 0
+    for _ in range(repeat):
+        command_counter.reset()
+        tracemalloc.start()
+        started = time.perf_counter()
+        last_messages = STRATEGIES[strategy]()
+        advertisers = find_waiting_advertisers(last_messages, ref, datetime.now() - timedelta(minutes=14))
+        timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        commands = command_counter.total
+
+    timings.sort()
+    return {
+        "min_ms": round(timings[0] * 1000, 2),
+        "median_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "commands": commands,
+        "peak_memory_kb": round(peak / 1024, 1),
+        "advertisers": len(advertisers),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite")
+    parser.add_argument("--scales", default="10,100,1000", help="comma separated numbers of group chats")
+    parser.add_argument("--messages", type=int, default=20, help="history messages per chat")
+    parser.add_argument("--ingest", type=int, default=20000, help="messages in the ingest benchmark")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--redis", action="store_true", help="also benchmark the redis strategy (needs REDIS_URL)")
+    args = parser.parse_args()
+
+    check_database()
+    if args.redis:
+        STRATEGIES["redis"] = HotStateRepository.get_last_messages_for_today
+
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "results": [],
+    }
+
+    for scale in [int(scale) for scale in args.scales.split(",")]:
+        dataset = generate_dataset(scale, args.messages)
+        if args.redis:
+            redis_client.delete(HotStateRepository.PENDING_KEY)
+            HotStateRepository.reconcile(ChatStateRepository.get_group_states(), dataset.moderators)
+        result = {
+            "chats": scale,
+            "checker": {name: bench_checker(dataset, name, args.repeat) for name in STRATEGIES},
+            "ingest": bench_ingest(dataset, args.ingest, args.batch_size),
+        }
+        report["results"].append(result)
+
+        print(f"\n{scale} chats - ingest: {result['ingest']['messages_per_second']} msg/s, "
+              f"{result['ingest']['commands']} commands")
+        print(f"{'strategy':<12}{'median ms':>12}{'commands':>10}{'peak KB':>10}{'advertisers':>13}")
+        for name, res in result["checker"].items():
+            print(f"{name:<12}{res['median_ms']:>12}{res['commands']:>10}"
+                  f"{res['peak_memory_kb']:>10}{res['advertisers']:>13}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults are written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
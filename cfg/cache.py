@@ -0,0 +1,9 @@
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from cfg.config import settings
+
+
+redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+# For the bot's event loop
+async_redis_client = AsyncRedis.from_url(settings.REDIS_URL, decode_responses=True)
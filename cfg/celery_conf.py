@@ -1,17 +1,71 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import (
+    setup_logging, worker_init, worker_process_init,
+    worker_process_shutdown, worker_shutdown
+)
 
 from cfg.config import settings
 
-celery_app = Celery('tasks', broker=settings.REDIS_URL)
+celery_app = Celery('tasks', broker=settings.REDIS_URL, backend=settings.REDIS_URL)
 
 celery_app.conf.beat_schedule = {
     'check_msg': {
         'task': 'tasks.msg_tasks.check_msg',
         'schedule': crontab(minute='*/15'),
     },
+    'reconcile_hot_state': {
+        'task': 'tasks.msg_tasks.reconcile_hot_state',
+        'schedule': crontab(minute=5),
+    },
+    'rollup_messages': {
+        'task': 'tasks.retention_tasks.rollup_messages',
+        'schedule': crontab(hour=3, minute=30),
+    },
 }
 
-celery_app.conf.include = ["tasks.msg_tasks"]
+celery_app.conf.include = ["tasks.msg_tasks", "tasks.retention_tasks"]
 
 celery_app.conf.timezone = 'Europe/Kiev'
+
+# Results are only needed by the check_msg chord
+celery_app.conf.result_expires = 60 * 60
+
+
+@worker_init.connect
+def bootstrap_indexes(**kwargs):
+    from repositories.indexes import ensure_indexes
+
+    ensure_indexes()
+
+
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    from utils.metrics import start_metrics_server
+
+    start_metrics_server(settings.WORKER_METRICS_PORT)
+
+
+@worker_process_init.connect
+def start_process_metrics(**kwargs):
+    """ Prefork: every pool process serves its own metrics on WORKER_METRICS_PORT + its index (1..N) """
+    from billiard.process import current_process
+    from utils.metrics import start_metrics_server
+
+    start_metrics_server(settings.WORKER_METRICS_PORT + (getattr(current_process(), "index", None) or 0) + 1)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_async_runner(**kwargs):
+    from utils.runner import async_runner
+
+    async_runner.stop()
+
+
+@setup_logging.connect
+def configure_logging(**kwargs):
+    """ Keep the queue-based logging of utils.logs instead of Celery's handlers """
+    from utils.logs import setup_logging as setup_app_logging
+
+    setup_app_logging()
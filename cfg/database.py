@@ -1,22 +1,104 @@
+import os
+import threading
+
 from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database
 
 from cfg.config import settings
-from utils.logs import log
+from utils.logs import get_logger
+from utils.metrics import MongoMetricsListener
+
+log = get_logger(__name__)
 
 
 db_url = settings.DATABASE_URL
-client = MongoClient(db_url)
-db = client["DB"]
-msg_db = db["messages"]
-chat_db = db["chats"]
-user_db = db["users"]
-ignored_user_db = db["ignored_users"]
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def create_client() -> MongoClient:
+    return MongoClient(
+        db_url,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[MongoMetricsListener()],
+    )
+
+
+def get_client() -> MongoClient:
+    """
+    MongoClient of the current process, created on first use.
+    A MongoClient must not be shared across fork(), so a forked child
+    (e.g. a prefork Celery worker) gets its own; the client is thread-safe
+    and shared by the threads of a process.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = create_client()
+                _client_pid = pid
+    return _client
+
+
+def _reset_after_fork() -> None:
+    # The parent's client (and its monitor threads) must not be used or
+    # closed in the child, it is simply forgotten
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_db() -> Database:
+    return get_client()[settings.MONGO_DB_NAME]
+
+
+class LazyCollection:
+    """
+    Descriptor for the `db` attribute of the repositories: resolves to the
+    collection on the client of the current process when accessed.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._client = None
+        self._collection = None
+
+    def __get__(self, instance, owner) -> Collection:
+        client = get_client()
+        if self._client is not client:
+            self._collection = client[settings.MONGO_DB_NAME][self.name]
+            self._client = client
+        return self._collection
+
+
+msg_db = LazyCollection("messages")
+chat_db = LazyCollection("chats")
+user_db = LazyCollection("users")
+ignored_user_db = LazyCollection("ignored_users")
+chat_state_db = LazyCollection("chat_state")
+msg_rollup_db = LazyCollection("message_rollups")
+job_state_db = LazyCollection("job_state")
+notification_rule_db = LazyCollection("notification_rules")
+response_stat_db = LazyCollection("response_stats")
 
 
 def ping_db():
     """ Check db connection """
     try:
-        client.admin.command("ping")
+        get_client().admin.command("ping")
         log.info("Connected to database")
     except Exception as e:
-        log.info("Error database connection. ", e)
+        log.error("Error database connection: %s", e)
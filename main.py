@@ -1,48 +1,152 @@
+import asyncio
+import random
+import time
+
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder, CommandHandler,
     CallbackQueryHandler, MessageHandler,
-    MessageReactionHandler, filters
+    MessageReactionHandler, TypeHandler, filters
 )
 
 from cfg.config import settings
 from cfg.database import ping_db
+from repositories.indexes import ensure_indexes
+from services.analytics import response_tracker
 from services.bot import Bot
-from utils.logs import log
+from services.chat_registry import chat_registry
+from services.deadlines import deadline_scheduler
+from services.outbound import outbound
+from services.reference_data import reference_data
+from services.update_checkpoint import update_checkpoint
+from services.write_behind import write_behind
+from services.webhook import run_webhook, validate_webhook_settings
+from utils.logs import get_logger
+from utils.metrics import instrument_handler, start_metrics_server
+
+log = get_logger(__name__)
+
+
+# Only the update types the handlers below process
+ALLOWED_UPDATES = [
+    Update.MESSAGE, Update.EDITED_MESSAGE,
+    Update.MESSAGE_REACTION, Update.CALLBACK_QUERY
+]
+
+COMMANDS = [
+    ("start", Bot.start),
+    ("help", Bot.help_command),
+    ("set_moderator", Bot.create_moderator),
+    ("get_all_moderators", Bot.moderators_list),
+    ("ignore", Bot.ignore),
+    ("ignore_phrase", Bot.ignore_phrase),
+    ("get_bot_groups", Bot.get_bot_groups),
+    ("set_notifications", Bot.set_notifications),
+    ("own_chat", Bot.own_chat),
+    ("disown_chat", Bot.disown_chat),
+    ("stats", Bot.stats),
+    ("leave_group", Bot.leave_group_chat),
+]
+
+
+async def on_startup(app) -> None:
+    await asyncio.to_thread(chat_registry.warm)
+    await asyncio.to_thread(reference_data.get)  # handlers only read the cached snapshot
+    await asyncio.to_thread(update_checkpoint.load)
+    if settings.RESPONSE_STATS:
+        await asyncio.to_thread(response_tracker.warm)
+    await write_behind.start()
+    if settings.REPLY_DEADLINE_SCHEDULER:
+        await deadline_scheduler.start()
+
+
+async def on_shutdown(app) -> None:
+    await deadline_scheduler.stop()
+    await outbound.stop()
+    await write_behind.stop()  # flushing pending writes
 
 
 def start_bot():
-    try:
-        app = ApplicationBuilder().token(settings.TG_TOKEN).build()
+    # run_polling closes its event loop, a restarted bot needs a new one
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    app = (
+        ApplicationBuilder()
+        .token(settings.TG_TOKEN)
+        .concurrent_updates(settings.CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    # Replays after a restart are dropped before any handler, see UpdateCheckpoint
+    app.add_handler(TypeHandler(Update, update_checkpoint.drop_replayed), group=-1)
+    app.add_handler(TypeHandler(Update, update_checkpoint.advance), group=1)
+
+    for command, callback in COMMANDS:
+        app.add_handler(CommandHandler(
+            command, instrument_handler(callback, callback.__name__),
+            filters=filters.UpdateType.MESSAGE  # edited commands are not run again
+        ))
+
+    message_handler = MessageHandler(
+        filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND,
+        instrument_handler(Bot.handle_message, "handle_message")
+    )
+    edited_handler = MessageHandler(
+        filters.UpdateType.EDITED_MESSAGE & filters.TEXT,
+        instrument_handler(Bot.handle_edited_message, "handle_edited_message")
+    )
+    reactions_handler = MessageReactionHandler(instrument_handler(Bot.handle_reaction, "handle_reaction"))
+    animations_handler = MessageHandler(
+        filters.UpdateType.MESSAGE & filters.ANIMATION,
+        instrument_handler(Bot.handle_animation, "handle_animation")
+    )
 
-        app.add_handler(CommandHandler("start", Bot.start))
-        app.add_handler(CommandHandler("help", Bot.help_command))
-        app.add_handler(CommandHandler("set_moderator", Bot.create_moderator))
-        app.add_handler(CommandHandler("get_all_moderators", Bot.moderators_list))
-        app.add_handler(CommandHandler("ignore", Bot.ignore))
-        app.add_handler(CommandHandler("get_bot_groups", Bot.get_bot_groups))
-        app.add_handler(CommandHandler("leave_group", Bot.leave_group_chat))
+    app.add_handler(message_handler)
+    app.add_handler(edited_handler)
+    app.add_handler(reactions_handler)
+    app.add_handler(animations_handler)
+    app.add_handler(CallbackQueryHandler(instrument_handler(Bot.default_buttons, "default_buttons")))
 
-        message_handler = MessageHandler(filters.TEXT & ~filters.COMMAND, Bot.handle_message)
-        reactions_handler = MessageReactionHandler(Bot.handle_reaction)
-        animations_handler = MessageHandler(filters.ANIMATION, Bot.handle_animation)
+    log.info("Bot is running and listening")
+    if settings.BOT_INGEST_MODE == "webhook":
+        asyncio.run(run_webhook(app, ALLOWED_UPDATES))
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
-        app.add_handler(message_handler)
-        app.add_handler(reactions_handler)
-        app.add_handler(animations_handler)
-        app.add_handler(CallbackQueryHandler(Bot.default_buttons))
 
-        log.info("Bot is running and listening")
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
-    except BaseException as e:
-        log.info(f"Bot Error: {e}")
-        start_bot()
+def supervise(run) -> None:
+    """
+    Run the bot until it stops cleanly, restarting it after a crash with
+    exponential backoff and jitter. The backoff is reset once a run lasted
+    BOT_RESTART_RESET_SECONDS.
+    """
+    failures = 0
+    while True:
+        started = time.monotonic()
+        try:
+            run()
+            return
+        except (KeyboardInterrupt, SystemExit):
+            return
+        except Exception:
+            if time.monotonic() - started > settings.BOT_RESTART_RESET_SECONDS:
+                failures = 0
+            failures += 1
+            delay = min(settings.BOT_RESTART_MAX_DELAY, settings.BOT_RESTART_BASE_DELAY * 2 ** (failures - 1))
+            delay *= random.uniform(0.5, 1.5)
+            log.exception("Bot crashed (failure %s), restarting in %.1fs", failures, delay)
+            time.sleep(delay)
 
 
 def main():
+    if settings.BOT_INGEST_MODE == "webhook":
+        validate_webhook_settings()
     ping_db()  # checking if db is running
+    ensure_indexes()
+    start_metrics_server(settings.METRICS_PORT)
     log.info("Bot is starting ...")
-    start_bot()  # starting bot
+    supervise(start_bot)  # starting bot
     log.info("Bot is shut down")
 
 
@@ -0,0 +1,184 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from cfg.cache import async_redis_client, redis_client
+from schemas.records import MessageRecord
+
+
+# Replaces the chat's hash unless it already holds a newer message and keeps
+# the chat in the pending set while its last message waits for a reply.
+# KEYS: chat hash, pending set
+# ARGV: created_at, chat_id, pending (1/0), ttl, field, value, ...
+RECORD_SCRIPT = """
+local current = tonumber(redis.call('hget', KEYS[1], 'created_at'))
+if current and current > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('hset', KEYS[1], unpack(ARGV, 5))
+redis.call('expire', KEYS[1], ARGV[4])
+if ARGV[3] == '1' then
+    redis.call('zadd', KEYS[2], ARGV[1], ARGV[2])
+else
+    redis.call('zrem', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# Marks the chat as notified, only while `message_id` is its last message
+# when one is given.
+# KEYS: chat hash, pending set
+# ARGV: chat_id, message_id or ''
+ACK_SCRIPT = """
+if ARGV[2] ~= '' and redis.call('hget', KEYS[1], 'message_id') ~= ARGV[2] then
+    return 0
+end
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('hset', KEYS[1], 'is_notified', '1')
+redis.call('zrem', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Replaces the text while `message_id` is still the last message
+# KEYS: chat hash
+# ARGV: message_id, text
+EDIT_SCRIPT = """
+if redis.call('hget', KEYS[1], 'message_id') ~= ARGV[1] then
+    return 0
+end
+redis.call('hset', KEYS[1], 'message', ARGV[2])
+return 1
+"""
+
+
+class HotStateRepository:
+    """
+    Last message of every group chat in Redis: a hash per chat plus the
+    `pending_chats` sorted set of the chats waiting for a moderator,
+    scored by the time of their last message.
+    Used by the "redis" LAST_MESSAGES_STRATEGY; Mongo stays the durable log
+    and `reconcile` rebuilds this state from chat_state.
+    """
+
+    PENDING_KEY = "pending_chats"
+    TTL = 2 * 24 * 60 * 60  # only today's messages are checked
+
+    _record = redis_client.register_script(RECORD_SCRIPT)
+    _async_record = async_redis_client.register_script(RECORD_SCRIPT)
+    _async_ack = async_redis_client.register_script(ACK_SCRIPT)
+    _async_edit = async_redis_client.register_script(EDIT_SCRIPT)
+
+    @staticmethod
+    def chat_key(chat_id: int) -> str:
+        return f"chat_state:{chat_id}"
+
+    @staticmethod
+    def encode(msg: MessageRecord, replied: bool) -> List:
+        created_at = msg.created_at
+        if created_at.tzinfo is None:  # naive datetimes from Mongo are UTC
+            created_at = created_at.replace(tzinfo=timezone.utc)
+
+        fields = {
+            **{key: value for key, value in msg.to_document().items() if value is not None},
+            "created_at": created_at.timestamp(),
+            "is_notified": int(msg.is_notified),
+            "replied": int(replied),
+        }
+        pending = not replied and not msg.is_notified
+        args = [fields["created_at"], msg.chat_id, int(pending), HotStateRepository.TTL]
+        for key, value in fields.items():
+            args.extend((key, value))
+        return args
+
+    @staticmethod
+    def decode(fields: Dict[str, str]) -> MessageRecord:
+        message_id = fields.get("message_id")
+        reply_to = fields.get("reply_to_message_id")
+        return MessageRecord(
+            chat_id=int(fields["chat_id"]),
+            name=fields.get("name"),
+            message=fields.get("message"),
+            username=fields.get("username"),
+            # naive UTC, like the datetimes read from Mongo
+            created_at=datetime.fromtimestamp(float(fields["created_at"]), timezone.utc).replace(tzinfo=None),
+            first_name=fields.get("first_name"),
+            last_name=fields.get("last_name"),
+            is_notified=fields.get("is_notified") == "1",
+            message_id=int(message_id) if message_id else None,
+            reply_to_message_id=int(reply_to) if reply_to else None,
+        )
+
+    @classmethod
+    async def record(cls, msg: MessageRecord, replied: bool) -> None:
+        """ Ingest: make `msg` the chat's last message unless a newer one is stored """
+        await cls._async_record(keys=[cls.chat_key(msg.chat_id), cls.PENDING_KEY], args=cls.encode(msg, replied))
+
+    @classmethod
+    async def ack(cls, chat_id: int, message_id: Optional[int] = None) -> None:
+        await cls._async_ack(
+            keys=[cls.chat_key(chat_id), cls.PENDING_KEY],
+            args=[chat_id, "" if message_id is None else message_id]
+        )
+
+    @classmethod
+    async def edit(cls, chat_id: int, message_id: int, text: Optional[str]) -> None:
+        await cls._async_edit(keys=[cls.chat_key(chat_id)], args=[message_id, text or ""])
+
+    @classmethod
+    def get_last_messages_for_today(
+            cls,
+            shard: int = 0,
+            shards: int = 1,
+            older_than: Optional[datetime] = None,
+    ) -> List[MessageRecord]:
+        """ Pending chats of the shard whose last message is from today (and before `older_than`) """
+        today_start = datetime.combine(datetime.today(), datetime.min.time()).timestamp()
+        until = older_than.timestamp() if older_than is not None else "+inf"
+
+        chat_ids = [
+            int(chat_id) for chat_id in redis_client.zrangebyscore(cls.PENDING_KEY, today_start, until)
+            if abs(int(chat_id)) % shards == shard
+        ]
+        if not chat_ids:
+            return []
+
+        pipe = redis_client.pipeline(transaction=False)
+        for chat_id in chat_ids:
+            pipe.hgetall(cls.chat_key(chat_id))
+
+        records, expired = [], []
+        for chat_id, fields in zip(chat_ids, pipe.execute()):
+            if fields:
+                records.append(cls.decode(fields))
+            else:
+                expired.append(chat_id)
+        if expired:
+            redis_client.zrem(cls.PENDING_KEY, *expired)
+        return records
+
+    @classmethod
+    def reconcile(cls, states: Iterable[MessageRecord], moderators: Iterable[str], batch_size: int = 500) -> int:
+        """
+        Write the given chat states (from Mongo) unless Redis already holds
+        a newer message, and drop chats older than today from the pending set.
+        Returns the number of chats processed.
+        """
+        moderators = frozenset(moderators)
+        processed = 0
+        pipe = redis_client.pipeline(transaction=False)
+        for state in states:
+            cls._record(
+                keys=[cls.chat_key(state.chat_id), cls.PENDING_KEY],
+                args=cls.encode(state, state.username in moderators),
+                client=pipe
+            )
+            processed += 1
+            if processed % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+
+        today_start = datetime.combine(datetime.today(), datetime.min.time()).timestamp()
+        redis_client.zremrangebyscore(cls.PENDING_KEY, "-inf", f"({today_start}")
+        return processed
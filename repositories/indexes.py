@@ -0,0 +1,100 @@
+from typing import Dict, List
+
+from pymongo.errors import OperationFailure
+
+from repositories.mongodb import (
+    ChatRepository, MessageRepository, ChatStateRepository,
+    UserRepository, IgnoredUserRepository, MessageRollupRepository,
+    JobStateRepository, NotificationRuleRepository, ResponseStatsRepository
+)
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+# Every repository declaring `indexes` must be listed here
+REPOSITORIES = [
+    ChatRepository,
+    MessageRepository,
+    ChatStateRepository,
+    UserRepository,
+    IgnoredUserRepository,
+    MessageRollupRepository,
+    JobStateRepository,
+    NotificationRuleRepository,
+    ResponseStatsRepository,
+]
+
+
+def ensure_indexes() -> None:
+    """
+    Create the declared indexes that are missing (idempotent) and report
+    indexes that exist but are not declared or have never been used.
+    TTL indexes delete data, so their expiry follows the declaration and
+    undeclared ones are dropped. A repository declaring one may define
+    `ttl_ready()`: the TTL index is not created or shortened until it is true.
+    """
+    for repository in REPOSITORIES:
+        collection = repository.db
+        existing: Dict[str, Dict] = collection.index_information()
+        declared: List[str] = [index.document["name"] for index in repository.indexes]
+
+        for index in repository.indexes:
+            name = index.document["name"]
+            expire_after = index.document.get("expireAfterSeconds")
+            if name in existing:
+                current = existing[name].get("expireAfterSeconds")
+                if expire_after is not None and current != expire_after:
+                    if (current is None or expire_after < current) and not ttl_ready(repository):
+                        continue
+                    log.info("Changing expiry of %s.%s to %ss", collection.name, name, expire_after)
+                    collection.database.command(
+                        "collMod", collection.name,
+                        index={"name": name, "expireAfterSeconds": expire_after}
+                    )
+                continue
+
+            if expire_after is not None and not ttl_ready(repository):
+                continue
+
+            log.info("Index %s.%s is missing, creating it", collection.name, name)
+            try:
+                collection.create_indexes([index])
+            except OperationFailure as e:
+                # e.g. duplicated values for a unique index, must be fixed by hand
+                log.info("Failed to create index %s.%s: %s", collection.name, name, e)
+
+        undeclared = set(existing) - set(declared) - {"_id_"}
+        for name in sorted(undeclared):
+            if "expireAfterSeconds" in existing[name]:
+                log.info("Dropping undeclared TTL index %s.%s", collection.name, name)
+                collection.drop_index(name)
+                undeclared.discard(name)
+        if undeclared:
+            log.info("Undeclared indexes on %s: %s", collection.name, sorted(undeclared))
+
+        unused = get_unused_indexes(repository)
+        if unused:
+            log.info("Unused indexes on %s since last restart: %s", collection.name, unused)
+
+
+def ttl_ready(repository) -> bool:
+    ready = getattr(repository, "ttl_ready", None)
+    if ready is None or ready():
+        return True
+    log.info(
+        "TTL index of %s is postponed: older documents are not rolled up yet, "
+        "run python -m scripts.purge_messages", repository.db.name
+    )
+    return False
+
+
+def get_unused_indexes(repository) -> List[str]:
+    try:
+        stats = repository.db.aggregate([{"$indexStats": {}}])
+        return sorted(
+            stat["name"] for stat in stats
+            if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0
+        )
+    except OperationFailure:  # $indexStats is not permitted for the user
+        return []
@@ -1,50 +1,131 @@
-from typing import List, Dict
-from datetime import datetime
+from typing import Any, Iterable, List, Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 
-from pymongo import DESCENDING
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from schemas.chats import ChatSchema
+from schemas.records import ChatRecord, MessageRecord
 from schemas.users import UserSchema
 from schemas.messages import MessageSchema, MessageSchemaUpdate
 from schemas.igonred_users import IgnoredUserSchema
+from schemas.rules import NotificationRuleSchema
 
 from cfg.config import settings
-from cfg.database import msg_db, chat_db, user_db, ignored_user_db
+from cfg.database import (
+    msg_db, chat_db, user_db, ignored_user_db,
+    chat_state_db, msg_rollup_db, job_state_db,
+    notification_rule_db, response_stat_db
+)
+
+from repositories.hot_state import HotStateRepository
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+def shard_filter(shard: int, shards: int) -> Dict:
+    """ Mongo filter selecting the chats of one shard (abs(chat_id) mod shards) """
+    return {"$expr": {"$eq": [{"$mod": [{"$abs": "$chat_id"}, shards]}, shard]}}
+
+
+def keyset_page(
+        collection: Collection,
+        query: Dict,
+        field: str,
+        projection: Dict,
+        limit: int,
+        after: Any = None,
+        before: Any = None,
+) -> Tuple[List[Dict], bool, bool]:
+    """
+    One page of documents ordered by `field` (which must be indexed),
+    starting after `after` or ending before `before`.
+    Returns the documents and whether there are previous / next pages.
+    """
+    if before is not None:
+        docs = list(
+            collection.find({**query, field: {"$lt": before}}, projection)
+            .sort(field, DESCENDING).limit(limit + 1)
+        )
+        has_prev = len(docs) > limit
+        return docs[:limit][::-1], has_prev, True
+
+    page_query = query if after is None else {**query, field: {"$gt": after}}
+    docs = list(collection.find(page_query, projection).sort(field, ASCENDING).limit(limit + 1))
+    return docs[:limit], after is not None, len(docs) > limit
 
-from utils.logs import log
+
+def in_shard(chat_id: int, shard: int, shards: int) -> bool:
+    return abs(chat_id) % shards == shard
 
 
 class ChatRepository:
     db: Collection = chat_db
+    indexes: List[IndexModel] = [
+        IndexModel([("chat_id", ASCENDING)], name="chat_id_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name"),
+    ]
 
     @classmethod
     def get_chats_by_id(cls, chat_id: int) -> List[ChatSchema]:
-        chats = cls.db.find({"chat_id": chat_id})
+        chats = cls.db.find({"chat_id": chat_id}, {"_id": 0})
         return [ChatSchema(**chat) for chat in chats]
 
+    @classmethod
+    def get_chat_names(cls) -> Dict[int, Optional[str]]:
+        chats = cls.db.find({"chat_id": {"$lt": 0}}, {"_id": 0, "chat_id": 1, "name": 1})
+        return {chat["chat_id"]: chat.get("name") for chat in chats}
+
     @classmethod
     def create_chat(cls, chat: ChatSchema) -> bool:
-        chats = cls.get_chats_by_id(chat.chat_id)
-        if chats:
+        op = cls.upsert_chat_op(ChatRecord.from_document(chat.model_dump()))
+        if not op:
             return False
 
-        if chat.chat_id < 0:  # Group chats have negative ids
-            cls.db.insert_one(chat.dict())
-            return True
+        res = cls.db.bulk_write([op])
+        return res.upserted_count > 0
 
-        return False
+    @classmethod
+    def upsert_chat_op(cls, chat: ChatRecord) -> Optional[UpdateOne]:
+        """
+        Idempotent write of a group chat which also keeps its title up to date.
+        Returns None for private chats.
+        """
+        if chat.chat_id >= 0:  # Group chats have negative ids
+            return None
+
+        return UpdateOne(
+            {"chat_id": chat.chat_id},
+            {
+                "$set": {"name": chat.name},
+                "$setOnInsert": {"chat_id": chat.chat_id, "created_at": chat.created_at}
+            },
+            upsert=True
+        )
 
     @classmethod
     def get_all_group_chats(cls) -> List[ChatSchema]:
-        chats = cls.db.find({"chat_id": {"$lt": 0}})
+        chats = cls.db.find({"chat_id": {"$lt": 0}}, {"_id": 0, "chat_id": 1, "name": 1, "created_at": 1})
         return [ChatSchema(**chat) for chat in chats]
 
+    @classmethod
+    def get_group_chats_page(
+            cls,
+            limit: int,
+            after: Optional[int] = None,
+            before: Optional[int] = None,
+    ) -> Tuple[List[Dict], bool, bool]:
+        """ Group chats ordered by chat_id, see keyset_page """
+        return keyset_page(
+            cls.db, {"chat_id": {"$lt": 0}}, "chat_id",
+            {"_id": 0, "chat_id": 1, "name": 1}, limit, after, before
+        )
+
     @classmethod
     def get_admins_chat_id(cls) -> int:
-        log.info(f"ADMINS_GROUP_CHAT_NAME: {settings.ADMINS_GROUP_CHAT_NAME}")
-        chat = cls.db.find_one({"name": settings.ADMINS_GROUP_CHAT_NAME})
-        log.info(f"CHAT: {chat}")
+        chat = cls.db.find_one({"name": settings.ADMINS_GROUP_CHAT_NAME}, {"_id": 0, "chat_id": 1})
         if not chat:
             return 0
 
@@ -58,21 +139,103 @@ class ChatRepository:
 
 class MessageRepository:
     db: Collection = msg_db
+    indexes: List[IndexModel] = [
+        IndexModel([("chat_id", ASCENDING), ("created_at", DESCENDING)], name="chat_id_created_at"),
+        IndexModel(
+            [("chat_id", ASCENDING), ("message_id", ASCENDING)], name="chat_id_message_id_unique", unique=True,
+            partialFilterExpression={"message_id": {"$exists": True}}
+        ),
+    ]
+    # At least 2 days, yesterday must still be there for the daily rollup
+    TTL_DAYS = max(settings.MESSAGE_RETENTION_DAYS, 2)
+    if settings.MESSAGE_RETENTION_DAYS > 0:
+        indexes.append(IndexModel(
+            [("created_at", ASCENDING)], name="created_at_ttl",
+            expireAfterSeconds=TTL_DAYS * 24 * 60 * 60
+        ))
 
     @classmethod
     def get_msgs_by_id(cls, chat_id: int) -> List[MessageSchema]:
-        msgs = cls.db.find({"chat_id": chat_id})
+        msgs = cls.db.find({"chat_id": chat_id}, MessageRecord.PROJECTION)
         return [MessageSchema(**msg) for msg in msgs]
 
+    @staticmethod
+    def natural_key(doc: Dict) -> Dict:
+        """
+        Filter identifying a message: (chat_id, message_id) when Telegram
+        gave it an id, otherwise the sender, time and reacted message
+        (reactions), both covered by an index.
+        """
+        if doc.get("message_id") is not None:
+            return {"chat_id": doc["chat_id"], "message_id": doc["message_id"]}
+        return {
+            "chat_id": doc["chat_id"], "created_at": doc["created_at"],
+            "username": doc.get("username"), "message": doc.get("message"),
+            "reply_to_message_id": doc.get("reply_to_message_id"),
+        }
+
     @classmethod
     def create_msg(cls, msg: MessageSchema) -> bool:
-        cls.db.insert_one(msg.dict())
-        return True
+        """ Returns False when the message was already stored """
+        doc = msg.model_dump()
+        for field in ("message_id", "reply_to_message_id"):  # see MessageRecord.to_document
+            if doc[field] is None:
+                del doc[field]
+        res = cls.db.update_one(cls.natural_key(doc), {"$setOnInsert": doc}, upsert=True)
+        return res.upserted_id is not None
 
     @classmethod
-    def get_last_message_from_all_group_chats_for_today(cls) -> List[MessageSchema]:
+    def create_msg_op(cls, msg: MessageRecord) -> UpdateOne:
+        """
+        Write operation for the write-behind queue. An upsert on the
+        natural key, so a re-delivered update is a no-op instead of a duplicate.
+        """
+        doc = msg.to_document()
+        return UpdateOne(cls.natural_key(doc), {"$setOnInsert": doc}, upsert=True)
+
+    @classmethod
+    def mark_notified_op(cls, chat_id: int, message_id: int) -> UpdateOne:
+        """ Write operation acknowledging one message, e.g. after a reaction """
+        return UpdateOne({"chat_id": chat_id, "message_id": message_id}, {"$set": {"is_notified": True}})
+
+    @classmethod
+    def edit_msg_op(cls, chat_id: int, message_id: int, text: Optional[str], edited_at: datetime) -> UpdateOne:
+        return UpdateOne(
+            {"chat_id": chat_id, "message_id": message_id},
+            {"$set": {"message": text, "edited_at": edited_at}}
+        )
+
+    @classmethod
+    def get_last_messages_for_today(
+            cls,
+            shard: int = 0,
+            shards: int = 1,
+            older_than: Optional[datetime] = None,
+    ) -> List[MessageRecord]:
+        """
+        Not notified last message of every group chat of the shard,
+        see LAST_MESSAGES_STRATEGY. The "redis" strategy also applies `older_than`.
+        """
+        strategy = settings.LAST_MESSAGES_STRATEGY
+        if strategy == "redis":
+            return HotStateRepository.get_last_messages_for_today(shard, shards, older_than)
+        if strategy == "chat_state":
+            return ChatStateRepository.get_last_messages_for_today(shard, shards)
+        if strategy == "aggregate":
+            return cls.get_last_message_from_all_group_chats_for_today_aggregated(shard, shards)
+        return cls.get_last_message_from_all_group_chats_for_today(shard, shards)
+
+    @classmethod
+    def get_last_message_from_all_group_chats_for_today(
+            cls,
+            shard: int = 0,
+            shards: int = 1
+    ) -> List[MessageRecord]:
         last_msgs = []
-        group_chats = ChatRepository.get_all_group_chats()
+        group_chats = [
+            chat for chat in ChatRepository.get_all_group_chats()
+            if in_shard(chat.chat_id, shard, shards)
+        ]
 
         # Get the current date at midnight
         today_start = datetime.combine(datetime.today(), datetime.min.time())
@@ -83,37 +246,271 @@ class MessageRepository:
                     "chat_id": chat.chat_id,
                     "created_at": {"$gte": today_start}
                 },
+                MessageRecord.PROJECTION,
                 sort=[("created_at", -1)])
             if last_msg:
                 if last_msg["is_notified"] is True:
                     continue
-                last_msgs.append(MessageSchema(**last_msg))
+                last_msgs.append(MessageRecord.from_document(last_msg))
         return last_msgs
 
     @classmethod
-    def mark_msg_as_notified(cls, msg: MessageSchema) -> None:
-        last_message = cls.db.find_one(
-            {"chat_id": msg.chat_id, "is_notified": False},
-            sort=[("_id", DESCENDING)]
+    def get_last_message_from_all_group_chats_for_today_aggregated(
+            cls,
+            shard: int = 0,
+            shards: int = 1
+    ) -> List[MessageRecord]:
+        """ Same as the per-chat loop, computed in a single aggregation """
+        # Get the current date at midnight
+        today_start = datetime.combine(datetime.today(), datetime.min.time())
+
+        match = {"chat_id": {"$lt": 0}, "created_at": {"$gte": today_start}}
+        if shards > 1:
+            match.update(shard_filter(shard, shards))
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"chat_id": 1, "created_at": -1}},
+            {"$group": {
+                "_id": "$chat_id",
+                "name": {"$first": "$name"},
+                "first_name": {"$first": "$first_name"},
+                "last_name": {"$first": "$last_name"},
+                "message": {"$first": "$message"},
+                "username": {"$first": "$username"},
+                "created_at": {"$first": "$created_at"},
+                "is_notified": {"$first": "$is_notified"},
+            }},
+            {"$match": {"is_notified": False}},
+            {"$addFields": {"chat_id": "$_id"}},
+            {"$project": {"_id": 0}},
+        ]
+        return [MessageRecord.from_document(msg) for msg in cls.db.aggregate(pipeline)]
+
+    @classmethod
+    def get_last_messages_by_chat(cls, chat_ids: List[int]) -> List[Dict]:
+        """ Last message document of every given chat in one aggregation """
+        pipeline = [
+            {"$match": {"chat_id": {"$in": chat_ids}}},
+            {"$sort": {"chat_id": 1, "created_at": -1}},
+            {"$group": {"_id": "$chat_id", "doc": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$doc"}},
+        ]
+        return list(cls.db.aggregate(pipeline, allowDiskUse=True))
+
+    @classmethod
+    def get_oldest_message_date(cls) -> Optional[datetime]:
+        msg = cls.db.find_one({}, {"_id": 0, "created_at": 1}, sort=[("created_at", ASCENDING)])
+        return msg["created_at"] if msg else None
+
+    @classmethod
+    def ttl_ready(cls) -> bool:
+        """
+        The TTL index deletes without rolling up, so it is only created (or
+        shortened) once no message older than it is left, i.e. after
+        scripts.purge_messages rolled up and deleted the backlog.
+        """
+        oldest = cls.get_oldest_message_date()
+        # The TTL monitor runs every minute, tolerate what it has not deleted yet
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=cls.TTL_DAYS, hours=1)
+        return oldest is None or oldest >= cutoff
+
+    @classmethod
+    def delete_older_than(cls, before: datetime, limit: int) -> int:
+        """ Delete up to `limit` messages created before `before` """
+        ids = [msg["_id"] for msg in cls.db.find({"created_at": {"$lt": before}}, {"_id": 1}).limit(limit)]
+        if not ids:
+            return 0
+        return cls.db.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+class ChatStateRepository:
+    """
+    One document per group chat with its last message.
+    Maintained on ingest, so the checker reads it instead of `messages`.
+    `alert_tier` / `alerted_at` track the alerts sent about the last
+    message, a new message resets them.
+    """
+    db: Collection = chat_state_db
+    indexes: List[IndexModel] = [
+        IndexModel([("chat_id", ASCENDING)], name="chat_id_unique", unique=True),
+    ]
+
+    # Alert tiers: first alert, reminder, escalation to personal messages
+    ALERT_FIRST = 1
+    ALERT_REMINDER = 2
+    ALERT_ESCALATION = 3
+
+    @classmethod
+    def upsert_state_op(
+            cls,
+            msg: MessageRecord,
+            reply_deadline: Optional[datetime] = None,
+            waiting_since: Optional[datetime] = None,
+            only_newer: bool = False,
+    ) -> UpdateOne:
+        """
+        Write operation that replaces the chat state with `msg`.
+        It only matches when the stored message is not newer, so replayed or
+        reordered writes fail on the unique chat_id index instead of
+        overwriting fresher state.
+        `reply_deadline` persists the timer of the deadline scheduler,
+        `waiting_since` the start of the wait tracked by the response stats.
+        `only_newer` also leaves a state holding the same message untouched,
+        with its timers and alert tier (backfills on a live system).
+        """
+        return UpdateOne(
+            {"chat_id": msg.chat_id, "created_at": {"$lt" if only_newer else "$lte": msg.created_at}},
+            {"$set": {
+                **msg.to_document(),
+                "message_id": msg.message_id,  # also replaced when unknown
+                "reply_deadline": reply_deadline,
+                "waiting_since": waiting_since,
+                "alert_tier": 0,
+                "alerted_at": None,
+            }},
+            upsert=True
         )
-            
+
+    @classmethod
+    def mark_notified_op(cls, chat_id: int, message_id: int) -> UpdateOne:
+        """ Acknowledges the chat only while `message_id` is still its last message """
+        return UpdateOne(
+            {"chat_id": chat_id, "message_id": message_id},
+            {"$set": {"is_notified": True, "reply_deadline": None}}
+        )
+
+    @classmethod
+    def edit_msg_op(cls, chat_id: int, message_id: int, text: Optional[str]) -> UpdateOne:
+        """ Edits only matter to the checker while they are the last message """
+        return UpdateOne({"chat_id": chat_id, "message_id": message_id}, {"$set": {"message": text}})
+
+    @classmethod
+    def get_state(cls, chat_id: int) -> Optional[MessageRecord]:
+        state = cls.db.find_one({"chat_id": chat_id}, MessageRecord.PROJECTION)
+        if not state:
+            return None
+        return MessageRecord.from_document(state)
+
+    @classmethod
+    def get_reply_deadlines(cls) -> Dict[int, datetime]:
+        states = cls.db.find(
+            {"reply_deadline": {"$ne": None}},
+            {"_id": 0, "chat_id": 1, "reply_deadline": 1}
+        )
+        return {state["chat_id"]: state["reply_deadline"] for state in states}
+
+    @classmethod
+    def get_waiting_since(cls) -> Dict[int, datetime]:
+        states = cls.db.find(
+            {"waiting_since": {"$ne": None}},
+            {"_id": 0, "chat_id": 1, "waiting_since": 1}
+        )
+        return {state["chat_id"]: state["waiting_since"] for state in states}
+
+    @classmethod
+    def clear_reply_deadline(cls, chat_id: int, reply_deadline: datetime) -> None:
         cls.db.update_one(
-            {"_id": last_message["_id"]},
-            {"$set": {"is_notified": True}}
+            {"chat_id": chat_id, "reply_deadline": reply_deadline},
+            {"$set": {"reply_deadline": None}}
         )
 
+    @classmethod
+    def alert_due_filter(cls, now: datetime, max_tier: int = ALERT_ESCALATION) -> Dict:
+        """ Chats whose next alert, up to `max_tier`, is due at `now` """
+        intervals = {
+            cls.ALERT_REMINDER: timedelta(minutes=settings.ALERT_REMINDER_MINUTES),
+            cls.ALERT_ESCALATION: timedelta(minutes=settings.ALERT_ESCALATION_MINUTES),
+        }
+        due = [{"alert_tier": {"$in": [None, 0]}}]  # None also matches states without the field
+        for tier in range(cls.ALERT_REMINDER, max_tier + 1):
+            due.append({"alert_tier": tier - 1, "alerted_at": {"$lte": now - intervals[tier]}})
+        return {"$or": due}
+
+    @classmethod
+    def claim_alert(
+            cls,
+            chat_id: int,
+            created_at: datetime,
+            now: datetime,
+            max_tier: int = ALERT_ESCALATION,
+    ) -> Optional[int]:
+        """
+        Compare-and-set: move the chat to its next alert tier when that tier
+        is due and `created_at` is still its last message. Concurrent checker
+        runs and the deadline scheduler therefore send each tier only once.
+        Returns the claimed tier, None when there is nothing to send.
+        """
+        state = cls.db.find_one_and_update(
+            {
+                "chat_id": chat_id,
+                "created_at": created_at,
+                "is_notified": False,
+                **cls.alert_due_filter(now, max_tier),
+            },
+            [{"$set": {"alert_tier": {"$add": [{"$ifNull": ["$alert_tier", 0]}, 1]}, "alerted_at": now}}],
+            projection={"_id": 0, "alert_tier": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return state["alert_tier"] if state else None
+
+    @classmethod
+    def get_last_messages_for_today(cls, shard: int = 0, shards: int = 1) -> List[MessageRecord]:
+        """ Not acknowledged last messages of today whose next alert is due """
+        # Get the current date at midnight
+        today_start = datetime.combine(datetime.today(), datetime.min.time())
+
+        query = {
+            "chat_id": {"$lt": 0},
+            "created_at": {"$gte": today_start},
+            "is_notified": False,
+            **cls.alert_due_filter(datetime.now(timezone.utc)),
+        }
+        if shards > 1:
+            query.update(shard_filter(shard, shards))
+        states = cls.db.find(query, MessageRecord.PROJECTION)
+        return [MessageRecord.from_document(state) for state in states]
+
+    @classmethod
+    def get_group_states(cls) -> Iterable[MessageRecord]:
+        states = cls.db.find({"chat_id": {"$lt": 0}}, MessageRecord.PROJECTION)
+        return (MessageRecord.from_document(state) for state in states)
+
+    @classmethod
+    def rebuild(cls, chat_ids: List[int]) -> int:
+        """ (Re)build the state of the given chats from `messages` """
+        last_msgs = MessageRepository.get_last_messages_by_chat(chat_ids)
+        ops = [cls.upsert_state_op(MessageRecord.from_document(msg), only_newer=True) for msg in last_msgs]
+        if not ops:
+            return 0
+
+        try:
+            res = cls.db.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:  # the state is already newer
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        return res.upserted_count + res.modified_count
+
 
 class UserRepository:
     db: Collection = user_db
+    indexes: List[IndexModel] = [
+        IndexModel(
+            [("username", ASCENDING)], name="username_unique", unique=True,
+            partialFilterExpression={"username": {"$type": "string"}}
+        ),
+        IndexModel([("is_moderator", ASCENDING), ("username", ASCENDING)], name="is_moderator_username"),
+    ]
 
     @classmethod
     def create_user(cls, user: UserSchema) -> bool:
-        users = list(cls.db.find({"username": user.username}))
-        if users:
+        try:
+            res = cls.db.update_one(
+                {"username": user.username},
+                {"$setOnInsert": user.model_dump()},
+                upsert=True
+            )
+        except DuplicateKeyError:  # inserted concurrently
             return False
-
-        cls.db.insert_one(user.dict())
-        return True
+        return res.upserted_id is not None
 
     @classmethod
     def get_user_by_username(cls, username: str) -> UserSchema:
@@ -122,35 +519,235 @@ class UserRepository:
 
     @classmethod
     def get_all_moderators(cls) -> List[UserSchema]:
-        users = cls.db.find({"is_moderator": True})
+        users = cls.db.find({"is_moderator": True}, {"_id": 0})
         return [UserSchema(**user) for user in users]
 
+    @classmethod
+    def get_moderators_page(
+            cls,
+            limit: int,
+            after: Optional[str] = None,
+            before: Optional[str] = None,
+    ) -> Tuple[List[Dict], bool, bool]:
+        """ Moderators ordered by username, see keyset_page """
+        return keyset_page(
+            cls.db, {"is_moderator": True, "username": {"$type": "string"}}, "username",
+            {"_id": 0, "username": 1}, limit, after, before
+        )
+
+    @classmethod
+    def get_moderator_usernames(cls) -> List[str]:
+        users = cls.db.find({"is_moderator": True}, {"_id": 0, "username": 1})
+        return [user["username"] for user in users if user.get("username")]
+
     @classmethod
     def set_notifications(cls, username: str, receive_notifications: bool) -> bool:
-        user = cls.db.find({"username": username})
-        if user:
-            cls.db.update_one({"username": username}, {"$set": {"receive_notifications": receive_notifications}})
-            return True
-        return False
+        res = cls.db.update_one(
+            {"username": username},
+            {"$set": {"receive_notifications": receive_notifications}}
+        )
+        return res.matched_count > 0
+
+    @classmethod
+    def set_owned_chat(cls, username: str, chat_id: int, owned: bool) -> bool:
+        update = {"$addToSet": {"owned_chats": chat_id}} if owned else {"$pull": {"owned_chats": chat_id}}
+        res = cls.db.update_one({"username": username, "is_moderator": True}, update)
+        return res.matched_count > 0
+
+    @classmethod
+    def get_notification_recipients(cls) -> List[Dict]:
+        """ Moderators that opted in and have a private chat with the bot """
+        users = cls.db.find(
+            {"is_moderator": True, "receive_notifications": True, "chat_id": {"$gt": 0}},
+            {"_id": 0, "username": 1, "chat_id": 1, "owned_chats": 1}
+        )
+        return list(users)
 
 
 class IgnoredUserRepository:
     db: Collection = ignored_user_db
+    indexes: List[IndexModel] = [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ]
 
     @classmethod
     def set_ignored_user(
             cls,
             user: IgnoredUserSchema
     ) -> bool:
-        ignored_user = cls.db.find({"username": user.username})
-        if list(ignored_user):
+        try:
+            res = cls.db.update_one(
+                {"username": user.username},
+                {"$setOnInsert": user.model_dump()},
+                upsert=True
+            )
+        except DuplicateKeyError:  # inserted concurrently
             return False
-
-        cls.db.insert_one(user.dict())
-        return True
+        return res.upserted_id is not None
 
     @classmethod
     def get_list_ignored_users(cls) -> List[IgnoredUserSchema]:
         ignored_user = cls.db.find()
         return [IgnoredUserSchema(**ign_usr) for ign_usr in ignored_user]
 
+    @classmethod
+    def get_ignored_usernames(cls) -> List[str]:
+        ignored_users = cls.db.find({}, {"_id": 0, "username": 1})
+        return [ign_usr["username"] for ign_usr in ignored_users]
+
+
+class MessageRollupRepository:
+    """ Per-chat daily summaries of `messages`, kept after raw messages expire """
+    db: Collection = msg_rollup_db
+    indexes: List[IndexModel] = [
+        IndexModel([("chat_id", ASCENDING), ("day", ASCENDING)], name="chat_id_day_unique", unique=True),
+    ]
+
+    @classmethod
+    def rollup_day(cls, day: datetime) -> None:
+        """
+        (Re)compute the summaries of one UTC day (`day` is its midnight)
+        server-side and merge them into the rollups collection
+        """
+        pipeline = [
+            {"$match": {"created_at": {"$gte": day, "$lt": day + timedelta(days=1)}}},
+            {"$group": {
+                "_id": "$chat_id",
+                "name": {"$last": "$name"},
+                "messages": {"$sum": 1},
+                "reactions": {"$sum": {"$cond": [{"$eq": ["$message", "REACTION"]}, 1, 0]}},
+                "animations": {"$sum": {"$cond": [{"$eq": ["$message", "GIF"]}, 1, 0]}},
+                "first_at": {"$min": "$created_at"},
+                "last_at": {"$max": "$created_at"},
+                "participants": {"$addToSet": "$username"},
+            }},
+            {"$addFields": {"chat_id": "$_id", "day": day}},
+            {"$project": {"_id": 0}},
+            {"$merge": {
+                "into": cls.db.name,
+                "on": ["chat_id", "day"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }},
+        ]
+        MessageRepository.db.aggregate(pipeline, allowDiskUse=True)
+
+    @classmethod
+    def get_rollups(cls, chat_id: int, start: datetime, end: datetime) -> List[Dict]:
+        return list(cls.db.find(
+            {"chat_id": chat_id, "day": {"$gte": start, "$lt": end}},
+            {"_id": 0}
+        ).sort("day", ASCENDING))
+
+
+class JobStateRepository:
+    """ Checkpoints of maintenance jobs and of update processing, so they can resume """
+    db: Collection = job_state_db
+    indexes: List[IndexModel] = []
+
+    @classmethod
+    def get_checkpoint(cls, job: str) -> Optional[Any]:
+        state = cls.db.find_one({"_id": job})
+        return state.get("checkpoint") if state else None
+
+    @classmethod
+    def set_checkpoint(cls, job: str, checkpoint: Any) -> None:
+        cls.db.update_one(
+            {"_id": job},
+            {"$set": {"checkpoint": checkpoint, "updated_at": datetime.now()}},
+            upsert=True
+        )
+
+    @classmethod
+    def advance_checkpoint_op(cls, job: str, checkpoint: int) -> UpdateOne:
+        """ Write operation that only ever moves a numeric checkpoint forward """
+        return UpdateOne({"_id": job}, {"$max": {"checkpoint": checkpoint}}, upsert=True)
+
+
+class NotificationRuleRepository:
+    db: Collection = notification_rule_db
+    indexes: List[IndexModel] = [
+        IndexModel(
+            [("type", ASCENDING), ("field", ASCENDING), ("value", ASCENDING)],
+            name="type_field_value_unique", unique=True
+        ),
+    ]
+
+    @classmethod
+    def get_rules(cls) -> List[Dict]:
+        return list(cls.db.find({}, {"_id": 0}))
+
+    @classmethod
+    def add_rule(cls, rule: NotificationRuleSchema) -> bool:
+        try:
+            res = cls.db.update_one(
+                rule.model_dump(),
+                {"$setOnInsert": rule.model_dump()},
+                upsert=True
+            )
+        except DuplicateKeyError:  # inserted concurrently
+            return False
+        return res.upserted_id is not None
+
+
+class ResponseStatsRepository:
+    """
+    Pre-aggregated reply times: one document per (granularity, bucket start,
+    chat, moderator) with counters, for hourly, daily and monthly buckets.
+    Maintained with $inc on every moderator reply, never recomputed.
+    """
+    db: Collection = response_stat_db
+    indexes: List[IndexModel] = [
+        IndexModel(
+            [("granularity", ASCENDING), ("start", ASCENDING), ("chat_id", ASCENDING), ("moderator", ASCENDING)],
+            name="bucket_unique", unique=True
+        ),
+    ]
+
+    @classmethod
+    def inc_op(
+            cls,
+            granularity: str,
+            start: datetime,
+            chat_id: int,
+            name: Optional[str],
+            moderator: Optional[str],
+            seconds: float,
+            within_sla: bool,
+    ) -> UpdateOne:
+        """ Write operation adding one reply to a bucket """
+        return UpdateOne(
+            {"granularity": granularity, "start": start, "chat_id": chat_id, "moderator": moderator},
+            {
+                "$inc": {"count": 1, "total_seconds": seconds, "within_sla": int(within_sla)},
+                "$max": {"max_seconds": seconds},
+                "$set": {"name": name},
+            },
+            upsert=True
+        )
+
+    @classmethod
+    def aggregate_buckets(cls, buckets: Dict[str, List[datetime]], group_by: Optional[str] = None) -> List[Dict]:
+        """
+        Sum the given buckets ({granularity: [starts]}), per "chat_id",
+        per "moderator" or in total when `group_by` is None.
+        """
+        match = {"$or": [
+            {"granularity": granularity, "start": {"$in": starts}}
+            for granularity, starts in buckets.items() if starts
+        ]}
+        if not match["$or"]:
+            return []
+
+        group_id = f"${group_by}" if group_by else None
+        return list(cls.db.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": group_id,
+                "name": {"$last": "$name"},
+                "count": {"$sum": "$count"},
+                "total_seconds": {"$sum": "$total_seconds"},
+                "max_seconds": {"$max": "$max_seconds"},
+                "within_sla": {"$sum": "$within_sla"},
+            }},
+        ]))
@@ -5,8 +5,8 @@ from pydantic import BaseModel
 
 
 class MessageSchema(BaseModel):
-    # TODO: add message_id
     chat_id: Optional[int]
+    message_id: Optional[int] = None
     name: Optional[str]
     first_name: Optional[str] = None
     last_name: Optional[str] = None
@@ -14,15 +14,17 @@ class MessageSchema(BaseModel):
     username: Optional[str]
     created_at: datetime
     is_notified: bool = False
+    reply_to_message_id: Optional[int] = None
 
 
 class MessageSchemaUpdate(BaseModel):
-    # TODO: add message_id
     chat_id: Optional[int] = None
+    message_id: Optional[int] = None
     name: Optional[str] = None
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     message: Optional[str] = None
     username: Optional[str] = None
     created_at: Optional[datetime] = None
-    is_notified: Optional[bool] = None
\ No newline at end of file
+    is_notified: Optional[bool] = None
+    reply_to_message_id: Optional[int] = None
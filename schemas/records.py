@@ -0,0 +1,92 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class MessageRecord:
+    """
+    Slotted counterpart of MessageSchema for the ingest and checker hot
+    paths: no validation, encoded straight to a Mongo document.
+    """
+    __slots__ = (
+        "chat_id", "name", "first_name", "last_name",
+        "message", "username", "created_at", "is_notified",
+        "message_id", "reply_to_message_id",
+    )
+
+    # Fields the checker reads, used as the Mongo projection
+    PROJECTION = {"_id": 0, **{field: 1 for field in __slots__}}
+
+    def __init__(
+            self,
+            chat_id: Optional[int],
+            name: Optional[str],
+            message: Optional[str],
+            username: Optional[str],
+            created_at: datetime,
+            first_name: Optional[str] = None,
+            last_name: Optional[str] = None,
+            is_notified: bool = False,
+            message_id: Optional[int] = None,
+            reply_to_message_id: Optional[int] = None,
+    ) -> None:
+        self.chat_id = chat_id
+        self.name = name
+        self.first_name = first_name
+        self.last_name = last_name
+        self.message = message
+        self.username = username
+        self.created_at = created_at
+        self.is_notified = is_notified
+        self.message_id = message_id
+        self.reply_to_message_id = reply_to_message_id
+
+    def to_document(self) -> Dict:
+        # message_id is left out when unknown, the (chat_id, message_id)
+        # unique index only covers documents that have it
+        doc = {
+            "chat_id": self.chat_id,
+            "name": self.name,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "message": self.message,
+            "username": self.username,
+            "created_at": self.created_at,
+            "is_notified": self.is_notified,
+        }
+        if self.message_id is not None:
+            doc["message_id"] = self.message_id
+        if self.reply_to_message_id is not None:
+            doc["reply_to_message_id"] = self.reply_to_message_id
+        return doc
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "MessageRecord":
+        return cls(
+            chat_id=doc.get("chat_id"),
+            name=doc.get("name"),
+            message=doc.get("message"),
+            username=doc.get("username"),
+            created_at=doc.get("created_at"),
+            first_name=doc.get("first_name"),
+            last_name=doc.get("last_name"),
+            is_notified=doc.get("is_notified", False),
+            message_id=doc.get("message_id"),
+            reply_to_message_id=doc.get("reply_to_message_id"),
+        )
+
+
+class ChatRecord:
+    """ Slotted counterpart of ChatSchema for the ingest hot path """
+    __slots__ = ("chat_id", "name", "created_at")
+
+    def __init__(self, chat_id: Optional[int], name: Optional[str], created_at: datetime) -> None:
+        self.chat_id = chat_id
+        self.name = name
+        self.created_at = created_at
+
+    def to_document(self) -> Dict:
+        return {"chat_id": self.chat_id, "name": self.name, "created_at": self.created_at}
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "ChatRecord":
+        return cls(doc.get("chat_id"), doc.get("name"), doc.get("created_at"))
@@ -0,0 +1,12 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class NotificationRuleSchema(BaseModel):
+    # "ignore_phrase" - the whole message (case-insensitive) does not need a reply
+    # "ignore_name" - regex on the sender's `field` (first_name / last_name)
+    # "skip_chat" - chat name or id that is never checked
+    type: str
+    value: str
+    field: Optional[str] = None
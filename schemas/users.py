@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -8,3 +8,4 @@ class UserSchema(BaseModel):
     chat_id: Optional[int]
     is_moderator: bool
     receive_notifications: bool
+    owned_chats: List[int] = []  # group chats to get personal notifications about, all when empty
@@ -0,0 +1,75 @@
+"""
+Import-time profile of the process entry points, using `python -X importtime`.
+Prints the most expensive modules and the total per entry point; with
+--budget-ms it exits with status 1 when an entry point got slower, so
+cold-start regressions can fail CI.
+
+    python -m scripts.import_profile
+    python -m scripts.import_profile --module tasks.msg_tasks --top 30 --budget-ms 400
+"""
+import argparse
+import subprocess
+import sys
+
+from typing import List, NamedTuple, Optional
+
+
+ENTRY_POINTS = ["cfg.celery_conf", "tasks.msg_tasks", "tasks.retention_tasks", "main"]
+
+
+class ModuleCost(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def profile_imports(module: Optional[str]) -> List[ModuleCost]:
+    """
+    Import `module` in a fresh interpreter and parse the -X importtime report,
+    None profiles the interpreter startup alone.
+    """
+    code = f"import {module}" if module else "pass"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    costs = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        costs.append(ModuleCost(name.strip(), int(self_us), int(cumulative_us)))
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-module import cost of the entry points")
+    parser.add_argument("--module", action="append", help="entry point to profile (repeatable)")
+    parser.add_argument("--top", type=int, default=15, help="modules to show per entry point")
+    parser.add_argument("--budget-ms", type=float, help="fail when an entry point takes longer")
+    args = parser.parse_args()
+
+    # Modules loaded by the interpreter itself are not the entry point's cost
+    startup_modules = {cost.module for cost in profile_imports(None)}
+
+    over_budget = []
+    for module in args.module or ENTRY_POINTS:
+        costs = [cost for cost in profile_imports(module) if cost.module not in startup_modules]
+        total_ms = sum(cost.self_us for cost in costs) / 1000
+
+        print(f"\n{module}: {total_ms:.1f} ms, {len(costs)} modules")
+        print(f"{'self ms':>10}{'cumulative ms':>15}  module")
+        for cost in sorted(costs, key=lambda c: c.self_us, reverse=True)[:args.top]:
+            print(f"{cost.self_us / 1000:>10.1f}{cost.cumulative_us / 1000:>15.1f}  {cost.module}")
+
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"\nOver the {args.budget_ms} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Post recorded Telegram updates (JSON files) to a locally running webhook.
+
+    python -m scripts.post_update updates/message.json updates/reaction.json
+"""
+import argparse
+import json
+
+import requests
+
+from cfg.config import settings
+from services.webhook import SECRET_TOKEN_HEADER
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post recorded updates to the webhook")
+    parser.add_argument("files", nargs="+", help="JSON files with one update or a list of updates")
+    parser.add_argument(
+        "--url",
+        default=f"http://127.0.0.1:{settings.WEBHOOK_PORT}/{settings.WEBHOOK_PATH.strip('/')}"
+    )
+    parser.add_argument("--secret", default=settings.WEBHOOK_SECRET_TOKEN)
+    args = parser.parse_args()
+
+    headers = {SECRET_TOKEN_HEADER: args.secret} if args.secret else {}
+    for path in args.files:
+        with open(path) as f:
+            data = json.load(f)
+
+        for update in data if isinstance(data, list) else [data]:
+            res = requests.post(args.url, json=update, headers=headers, timeout=10)
+            print(f"{path} update {update.get('update_id')}: {res.status_code}")
+
+
+if __name__ == '__main__':
+    main()
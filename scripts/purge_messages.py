@@ -0,0 +1,30 @@
+"""
+Roll up and delete the backlog of messages older than the retention period.
+Safe to interrupt and run again, it resumes where it stopped.
+
+    python -m scripts.purge_messages --batch-size 1000 --pause 0.5
+"""
+import argparse
+
+from cfg.config import settings
+from repositories.indexes import ensure_indexes
+from services.retention import purge_messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge messages older than the retention period")
+    parser.add_argument("--older-than-days", type=int, default=settings.MESSAGE_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=1000, help="messages per delete")
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds between deletes")
+    args = parser.parse_args()
+
+    if args.older_than_days < 1:
+        raise SystemExit("--older-than-days must be at least 1")
+
+    ensure_indexes()  # the TTL index waits for the purge, see MessageRepository.ttl_ready
+    purge_messages(args.older_than_days, args.batch_size, args.pause)
+    ensure_indexes()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Rebuild the `chat_state` collection from `messages`.
+
+    python -m scripts.rebuild_chat_state --batch-size 200
+"""
+import argparse
+
+from repositories.indexes import ensure_indexes
+from repositories.mongodb import ChatRepository, ChatStateRepository
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+def rebuild_chat_state(batch_size: int) -> None:
+    ensure_indexes()
+    chat_ids = sorted(ChatRepository.get_chat_names())
+    log.info("Rebuilding chat state for %s group chats", len(chat_ids))
+
+    updated = 0
+    for start in range(0, len(chat_ids), batch_size):
+        batch = chat_ids[start:start + batch_size]
+        updated += ChatStateRepository.rebuild(batch)
+        log.info("Processed %s/%s chats, %s states written", start + len(batch), len(chat_ids), updated)
+
+    log.info("Chat state is rebuilt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild chat_state from messages")
+    parser.add_argument("--batch-size", type=int, default=200, help="chats per aggregation")
+    args = parser.parse_args()
+    rebuild_chat_state(args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
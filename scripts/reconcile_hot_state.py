@@ -0,0 +1,34 @@
+"""
+Rebuild the Redis hot state (LAST_MESSAGES_STRATEGY=redis) from `chat_state`.
+Run it once before switching the strategy; afterwards the hourly
+reconcile_hot_state task keeps it in sync.
+
+    python -m scripts.reconcile_hot_state
+"""
+import argparse
+
+from repositories.hot_state import HotStateRepository
+from repositories.mongodb import ChatStateRepository, UserRepository
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+def reconcile_hot_state(batch_size: int) -> None:
+    processed = HotStateRepository.reconcile(
+        ChatStateRepository.get_group_states(),
+        UserRepository.get_moderator_usernames(),
+        batch_size=batch_size
+    )
+    log.info("Hot state is rebuilt for %s chats", processed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the Redis hot state from chat_state")
+    parser.add_argument("--batch-size", type=int, default=500, help="chats per Redis pipeline")
+    args = parser.parse_args()
+    reconcile_hot_state(args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
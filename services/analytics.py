@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from cfg.config import settings
+from schemas.records import MessageRecord
+from repositories.mongodb import ChatStateRepository, ResponseStatsRepository
+from services.reference_data import reference_data
+from services.rules import is_moderator_reply, is_waiting_for_reply
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+GRANULARITIES = ("hour", "day", "month")
+
+
+def as_naive_utc(date_time: datetime) -> datetime:
+    """ Bucket starts are stored like Mongo returns datetimes: naive UTC """
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return date_time
+
+
+def bucket_start(granularity: str, date_time: datetime) -> datetime:
+    date_time = as_naive_utc(date_time)
+    if granularity == "hour":
+        return date_time.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return date_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    return date_time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_bucket(granularity: str, start: datetime) -> datetime:
+    if granularity == "hour":
+        return start + timedelta(hours=1)
+    if granularity == "day":
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def decompose(start: datetime, end: datetime) -> Dict[str, List[datetime]]:
+    """
+    Cover [start, end) with the fewest buckets, at hour precision: whole
+    months in the middle, days and hours at the edges. At most ~100 buckets
+    plus one per month, whatever the amount of traffic in the range.
+    """
+    buckets: Dict[str, List[datetime]] = {granularity: [] for granularity in GRANULARITIES}
+    current = bucket_start("hour", start)
+    end = as_naive_utc(end)
+    while current < end:
+        for granularity in reversed(GRANULARITIES):
+            if bucket_start(granularity, current) == current and next_bucket(granularity, current) <= end:
+                break
+        else:
+            granularity = "hour"  # partial last hour
+        buckets[granularity].append(current)
+        current = next_bucket(granularity, current)
+    return buckets
+
+
+class ResponseTracker:
+    """
+    Time from an advertiser's first unanswered message to the first reply
+    of a moderator, per chat. The start of the wait is kept in memory and
+    persisted in chat_state.waiting_since; every reply adds one sample to
+    the hourly, daily and monthly buckets of response_stats.
+    """
+
+    def __init__(self, sla: timedelta) -> None:
+        self.sla = sla
+        self._waiting_since: Dict[int, datetime] = {}
+
+    def warm(self) -> None:
+        self._waiting_since = {
+            chat_id: as_naive_utc(since) for chat_id, since in ChatStateRepository.get_waiting_since().items()
+        }
+        log.info("Response tracker is warmed with %s waiting chats", len(self._waiting_since))
+
+    def on_message(self, msg: MessageRecord) -> Tuple[Optional[datetime], List[UpdateOne]]:
+        """ Returns the start of the chat's wait to persist and the stats writes """
+        if msg.name == settings.ADMINS_GROUP_CHAT_NAME:
+            return None, []
+
+        ref = reference_data.cached()
+        created_at = as_naive_utc(msg.created_at)
+        waiting_since = self._waiting_since.get(msg.chat_id)
+
+        if waiting_since is None:
+            if is_waiting_for_reply(msg, ref):
+                self._waiting_since[msg.chat_id] = created_at
+                return created_at, []
+            return None, []
+
+        if not is_moderator_reply(msg, ref):
+            return waiting_since, []
+
+        del self._waiting_since[msg.chat_id]
+        seconds = max(0.0, (created_at - waiting_since).total_seconds())
+        within_sla = seconds <= self.sla.total_seconds()
+        ops = [
+            ResponseStatsRepository.inc_op(
+                granularity, bucket_start(granularity, created_at),
+                msg.chat_id, msg.name, msg.username, seconds, within_sla
+            )
+            for granularity in GRANULARITIES
+        ]
+        return None, ops
+
+
+def response_stats(
+        start: datetime,
+        end: datetime,
+        group_by: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Reply time statistics over [start, end) (hour precision), in total or
+    per "chat_id" / "moderator". Reads a bounded number of buckets, so the
+    cost does not grow with the length of the range or the traffic.
+    """
+    stats = []
+    for row in ResponseStatsRepository.aggregate_buckets(decompose(start, end), group_by):
+        stats.append({
+            "key": row["_id"],
+            "name": row.get("name"),
+            "count": row["count"],
+            "avg_seconds": row["total_seconds"] / row["count"] if row["count"] else 0.0,
+            "max_seconds": row["max_seconds"],
+            "within_sla": row["within_sla"] / row["count"] if row["count"] else 0.0,
+        })
+    return stats
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s"
+
+
+def format_stats_report(days: int, top: int = 5) -> str:
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+
+    total = response_stats(start, end)
+    if not total:
+        return f"No replies in the last {days} days"
+
+    total = total[0]
+    sla_minutes = int(settings.REPLY_DEADLINE_MINUTES)
+    lines = [
+        f"Replies in the last {days} days: {total['count']}",
+        f"Average reply time: {format_duration(total['avg_seconds'])}, "
+        f"max: {format_duration(total['max_seconds'])}",
+        f"Replied within {sla_minutes} minutes: {total['within_sla']:.0%}",
+    ]
+
+    chats = sorted(response_stats(start, end, "chat_id"), key=lambda row: row["avg_seconds"], reverse=True)
+    lines.append("\nSlowest chats:")
+    lines += [
+        f"- {row['name'] or row['key']}: {format_duration(row['avg_seconds'])} ({row['count']} replies)"
+        for row in chats[:top]
+    ]
+
+    moderators = sorted(response_stats(start, end, "moderator"), key=lambda row: row["count"], reverse=True)
+    lines.append("\nModerators:")
+    lines += [
+        f"- @{row['key']}: {row['count']} replies, {format_duration(row['avg_seconds'])} on average"
+        for row in moderators[:top]
+    ]
+    return "\n".join(lines)
+
+
+response_tracker = ResponseTracker(sla=timedelta(minutes=settings.REPLY_DEADLINE_MINUTES))
@@ -1,22 +1,40 @@
+import asyncio
+
 from typing import List
 from zoneinfo import ZoneInfo
 from datetime import datetime
 
-from telegram import Bot as TGBot
+from redis.exceptions import RedisError
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, CallbackContext
 
-from utils.logs import log
+from utils.logs import get_logger
 from cfg.config import settings
 
 from schemas.users import UserSchema
 from schemas.igonred_users import IgnoredUserSchema
+from schemas.records import ChatRecord, MessageRecord
+from schemas.rules import NotificationRuleSchema
 
 from repositories.mongodb import (
     ChatRepository, MessageRepository,
-    MessageSchema, ChatSchema, UserRepository,
-    IgnoredUserRepository, MessageSchemaUpdate
+    UserRepository, IgnoredUserRepository,
+    MessageSchemaUpdate, ChatStateRepository,
+    NotificationRuleRepository, ResponseStatsRepository
 )
+from repositories.hot_state import HotStateRepository
+from services.analytics import format_stats_report, response_tracker
+from services.chat_registry import chat_registry
+from services.deadlines import deadline_scheduler
+from services.outbound import outbound
+from services.pagination import GROUPS, MODERATORS, page_cache, parse_page_callback
+from services.reference_data import reference_data
+from services.rules import is_moderator_reply
+from services.write_behind import write_behind
+
+log = get_logger(__name__)
+
+STATS_MAX_DAYS = 5 * 366  # /stats reads at most ~5 years of monthly buckets
 
 
 class Bot:
@@ -42,88 +60,113 @@ class Bot:
         username = update.message.from_user.username
         first_name = getattr(update.message.from_user, 'first_name', None)
         last_name = getattr(update.message.from_user, 'last_name', None)
-        
-        log.info(f"Chat ID: {chat_id}, type : {type(chat_id)}")  # Optional[int]
-        log.info(f"Chat Name: {chat_name}, type : {type(chat_name)}")  # Optional[str]
-        log.info(f"Message: {message_text}, type : {type(message_text)}")  # Optional[str]
-        log.info(f"Username: {username} ,type :{type(username)}")  # Optional[str]
+        reply_to = update.message.reply_to_message
+
+        log.debug("Message in chat %s from %s", chat_id, username, extra={"sample": True})
 
-        msg: MessageSchema = MessageSchema(
+        msg: MessageRecord = MessageRecord(
             chat_id=chat_id, name=chat_name,
             message=message_text, username=username,
             created_at=local_date_time, first_name=first_name,
-            last_name=last_name
+            last_name=last_name, message_id=update.message.message_id,
+            reply_to_message_id=reply_to.message_id if reply_to else None
         )
 
-        chat: ChatSchema = ChatSchema(
+        chat: ChatRecord = ChatRecord(
             chat_id=chat_id, name=chat_name,
             created_at=local_date_time
         )
 
-        ChatRepository.create_chat(chat)
+        chat_op = chat_registry.observe(chat)
+        if chat_op:
+            await write_behind.put(ChatRepository.db, chat_op)
         if msg.name != settings.ADMINS_GROUP_CHAT_NAME:
-            MessageRepository.create_msg(msg)
+            await Bot.store_msg(msg)
     
     @staticmethod
     async def handle_reaction(
             update: Update,
             context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
-        utc_date_time = update.message.date if hasattr(update.message, 'date') else None
-        if not utc_date_time:
-            utc_date_time = datetime.now()
+        reaction = update.message_reaction
+        if reaction.user is None:  # anonymous admins and channels
+            return
+
         gmt_plus_3 = ZoneInfo('Etc/GMT-3')  # 'Etc/GMT-3' corresponds to GMT+3
-        local_date_time = utc_date_time.astimezone(gmt_plus_3)
-        
-        chat_id = update.message_reaction.chat.id
-        chat_name = update.message_reaction.chat.title
-        message_id = update.message_reaction.message_id
-        first_name = update.message_reaction.user.first_name
-        last_name = update.message_reaction.user.last_name
-        username = update.message_reaction.user.username
-        new_reactions = update.message_reaction.new_reaction
-        log.info(f"Chat ID: {chat_id}, type : {type(chat_id)}")
-        log.info(f"Message ID: {message_id}, type : {type(message_id)}")
-        log.info(f"First Name: {first_name}, last name: {last_name}")
-        log.info(f"User: {username}, type : {type(username)}")
-        log.info(f"New Reactions: {new_reactions}, type : {type(new_reactions)}")
-        # TODO: afted testing delete all above
-        # message = MessageSchemaUpdate(
-        #     # message_id=message_id,
-        #     chat_id=chat_id,
-        #     name=update.message_reaction.chat.title,
-        #     username=username,
-        # )
-        
-        # log.info(f"GROUPS_TO_MONITOR_REACTIONS: {settings.GROUPS_TO_MONITOR_REACTIONS}")
-        # if update.message_reaction.chat.title in settings.GROUPS_TO_MONITOR_REACTIONS:
-        #     log.info(f"Message is in the list of groups to monitor reactions")
-        #     try:
-        #         log.info(f"Trying to mark message as notified after reaction")
-        #         MessageRepository.mark_msg_as_notified(message)
-        #     except Exception as e:
-        #         log.info(f"Error while marking message as notified: {e}")
+        local_date_time = reaction.date.astimezone(gmt_plus_3)
+
+        chat_id = reaction.chat.id
+        chat_name = reaction.chat.title
+        message_id = reaction.message_id
+        first_name = reaction.user.first_name
+        last_name = reaction.user.last_name
+        username = reaction.user.username
+        new_reactions = reaction.new_reaction
+        log.debug(
+            "Reaction in chat %s to message %s from %s", chat_id, message_id, username,
+            extra={"sample": True}
+        )
+
         if first_name is None:
             first_name = ""
         if last_name is None:
             last_name = ""
-        
+
         # if "stark" in first_name.lower() or "stark" in last_name.lower():
-        msg: MessageSchema = MessageSchema(
+        msg: MessageRecord = MessageRecord(
             chat_id=chat_id, name=chat_name,
             message="REACTION", username=username,
             created_at=local_date_time, first_name=first_name,
-            last_name=last_name
+            last_name=last_name, reply_to_message_id=message_id,
         )
-        MessageRepository.create_msg(msg)
+
+        # A staff reaction acknowledges exactly the message it was put on,
+        # anyone else's reaction is an ordinary message waiting for a reply
+        acknowledged = (
+            bool(new_reactions)
+            and chat_name in settings.GROUPS_TO_MONITOR_REACTIONS
+            and is_moderator_reply(msg, reference_data.cached())
+        )
+        if acknowledged:
+            msg.is_notified = True
+            await write_behind.put(MessageRepository.db, MessageRepository.mark_notified_op(chat_id, message_id))
+            await write_behind.put(ChatStateRepository.db, ChatStateRepository.mark_notified_op(chat_id, message_id))
+            if settings.LAST_MESSAGES_STRATEGY == "redis":
+                await Bot.update_hot_state(HotStateRepository.ack(chat_id, message_id))
+
+            # Only kept in the history: as the chat's last message it would undo
+            # the acknowledgement (chat state, hot state, newest message)
+            await write_behind.put(MessageRepository.db, MessageRepository.create_msg_op(msg))
+            return
+        await Bot.store_msg(msg)
     
+    @staticmethod
+    async def handle_edited_message(
+            update: Update,
+            context: ContextTypes.DEFAULT_TYPE,
+    ) -> None:
+        """ Keep the stored text in sync, rules see the edited message """
+        message = update.edited_message
+        if not message or message.chat.id >= 0:
+            return
+
+        edited_at = (message.edit_date or message.date).astimezone(ZoneInfo('Etc/GMT-3'))
+        await write_behind.put(
+            MessageRepository.db,
+            MessageRepository.edit_msg_op(message.chat.id, message.message_id, message.text, edited_at)
+        )
+        await write_behind.put(
+            ChatStateRepository.db,
+            ChatStateRepository.edit_msg_op(message.chat.id, message.message_id, message.text)
+        )
+        if settings.LAST_MESSAGES_STRATEGY == "redis":
+            await Bot.update_hot_state(HotStateRepository.edit(message.chat.id, message.message_id, message.text))
+
     @staticmethod
     async def handle_animation(
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
-        log.info("ANIMATION HANDLER")
-        
         utc_date_time = update.message.date if hasattr(update.message, 'date') else None
         if not utc_date_time:
             utc_date_time = datetime.now()
@@ -135,20 +178,47 @@ class Bot:
         username = update.effective_sender.username
         first_name = update.effective_sender.first_name
         last_name = update.effective_sender.last_name
-        msg: MessageSchema = MessageSchema(
+        msg: MessageRecord = MessageRecord(
             chat_id=chat_id, name=chat_name,
             message="GIF", username=username,
             created_at=local_date_time, first_name=first_name,
-            last_name=last_name
+            last_name=last_name, message_id=update.message.message_id
         )
-        animation = update.message.animation.file_name
-        log.info(f"Message: {animation}, type : {type(animation)}")
-        MessageRepository.create_msg(msg)
+        log.debug("Animation in chat %s from %s", chat_id, username, extra={"sample": True})
+        await Bot.store_msg(msg)
+
+    @staticmethod
+    async def store_msg(msg: MessageRecord) -> None:
+        """ Enqueue the message and the update of its chat state """
+        await write_behind.put(MessageRepository.db, MessageRepository.create_msg_op(msg))
+        if msg.chat_id < 0:  # Group chats have negative ids
+            reply_deadline = None
+            if settings.REPLY_DEADLINE_SCHEDULER:
+                reply_deadline = deadline_scheduler.on_message(msg)
+            waiting_since = None
+            if settings.RESPONSE_STATS:
+                waiting_since, stats_ops = response_tracker.on_message(msg)
+                for op in stats_ops:
+                    await write_behind.put(ResponseStatsRepository.db, op)
+            await write_behind.put(
+                ChatStateRepository.db,
+                ChatStateRepository.upsert_state_op(msg, reply_deadline, waiting_since)
+            )
+            if settings.LAST_MESSAGES_STRATEGY == "redis":
+                replied = msg.username in reference_data.cached().moderators
+                await Bot.update_hot_state(HotStateRepository.record(msg, replied))
+
+    @staticmethod
+    async def update_hot_state(update) -> None:
+        """ A failed Redis update is not fatal, the reconciliation job rebuilds it from Mongo """
+        try:
+            await update
+        except RedisError as e:
+            log.warning("Hot state update failed: %s", e)
 
     @staticmethod
     async def send_message_to_chat(chat_id: int, message: str) -> None:
-        bot = TGBot(token=settings.TG_TOKEN)
-        await bot.send_message(chat_id=chat_id, text=message)
+        await outbound.send(chat_id, message)
 
     # ============== Command handlers ===============
     @staticmethod
@@ -166,7 +236,10 @@ class Bot:
     async def default_buttons(update: Update, context: CallbackContext) -> None:
         query = update.callback_query
         await query.answer()
-        if query.data == 'help':
+        page = parse_page_callback(query.data)
+        if page:
+            await Bot.show_page(query, *page)
+        elif query.data == 'help':
             await Bot.help_command(query, context)
         elif query.data == 'set_moderator':
             await Bot.create_moderator(query, context)
@@ -175,6 +248,12 @@ class Bot:
         elif query.data == 'get_bot_groups':
             await Bot.get_bot_groups(query, context)
 
+    @staticmethod
+    async def show_page(query, kind: str, direction: str, cursor: str) -> None:
+        """ Replace the list in the message with its previous / next page """
+        page = page_cache.get(kind, direction, cursor)
+        await query.edit_message_text(page.text, reply_markup=page.reply_markup)
+
     @staticmethod
     async def help_command(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text(
@@ -184,7 +263,12 @@ class Bot:
             "/set_moderator - Make me a moderator\n"
             "/get_all_moderators - Get all moderators\n"
             "/ignore {username you want to ignore} - Set user's username to ignore for notification list\n"
+            "/ignore_phrase {message} - Messages equal to this phrase won't notify\n"
             "/get_bot_groups - Get all groups bot in\n"
+            "/set_notifications {on|off} - Turn your personal notifications on or off\n"
+            "/own_chat - (in a group) Get personal notifications only about your groups\n"
+            "/disown_chat - (in a group) Stop getting personal notifications about this group\n"
+            "/stats {days} - Reply time statistics, for the last 7 days by default\n"
         )
 
     @staticmethod
@@ -195,14 +279,15 @@ class Bot:
             is_moderator=True,
             receive_notifications=True
         )
-        UserRepository.create_user(user)
+        if UserRepository.create_user(user):
+            reference_data.invalidate()
+            page_cache.invalidate(MODERATORS)
         await update.message.reply_text('You are a moderator now!')
 
     @staticmethod
     async def moderators_list(update: Update, context: CallbackContext) -> None:
-        moderators = UserRepository.get_all_moderators()
-        moderators_list = "\n".join([f"@{mod.username}" for mod in moderators])
-        await update.message.reply_text(f"Moderators:\n{moderators_list}")
+        page = page_cache.get(MODERATORS)
+        await update.message.reply_text(page.text, reply_markup=page.reply_markup)
 
     @staticmethod
     async def ignore(
@@ -227,9 +312,10 @@ class Bot:
             user: IgnoredUserSchema = IgnoredUserSchema(username=username)
 
         res: bool = IgnoredUserRepository.set_ignored_user(user)
-        log.info(f"Does the user with username {user.username} added to ignore: {res}")
+        log.info("Does the user with username %s added to ignore: %s", user.username, res)
 
         if res:
+            reference_data.invalidate()
             res_msg: str = f"The messages from {user.username} will " \
                            f"be ignored, and won't notify"
         else:
@@ -238,26 +324,100 @@ class Bot:
 
         await update.message.reply_text(res_msg)
 
-    @classmethod
-    async def get_bot_groups(cls, update: Update, context: CallbackContext) -> None:
-        """Command to retrieve all group chats the bot is in."""
-        group_chats = ChatRepository.get_all_group_chats()
-        
-        log.info(f"Group chats: {group_chats}")
-        
-        if not group_chats:
-            await update.message.reply_text(
-                "I am not in any group chats!"
-            )
+    @staticmethod
+    async def ignore_phrase(
+            update: Update,
+            context: CallbackContext
+    ) -> None:
+
+        if not update.message:
             return
 
-        group_list = "\n".join([chat.name for chat in group_chats])
+        msg: List[str] = update.message.text.split(" ", 1)
+        if len(msg) != 2 or not msg[1].strip():
+            await update.message.reply_text(f"The command is incorrect \n"
+                                            f"Correct from is - /ignore_phrase 'message'")
+            return
+
+        rule = NotificationRuleSchema(type="ignore_phrase", value=msg[1].strip().lower())
+        res: bool = NotificationRuleRepository.add_rule(rule)
+
+        if res:
+            reference_data.invalidate()
+            res_msg: str = f"Messages \"{rule.value}\" won't notify"
+        else:
+            res_msg: str = f"The phrase \"{rule.value}\" is already ignored"
+
+        await update.message.reply_text(res_msg)
+
+    @staticmethod
+    async def set_notifications(update: Update, context: CallbackContext) -> None:
+        if not update.message:
+            return
+
+        msg: List[str] = update.message.text.split(" ")
+        if len(msg) != 2 or msg[1].lower() not in ("on", "off"):
+            await update.message.reply_text(f"The command is incorrect \n"
+                                            f"Correct from is - /set_notifications on|off")
+            return
+
+        enabled = msg[1].lower() == "on"
+        if not UserRepository.set_notifications(update.message.from_user.username, enabled):
+            await update.message.reply_text("Only moderators receive notifications, use /set_moderator first")
+            return
+
+        await update.message.reply_text(f"Personal notifications are {'on' if enabled else 'off'}")
+
+    @staticmethod
+    async def own_chat(update: Update, context: CallbackContext) -> None:
+        await Bot._set_owned_chat(update, owned=True)
+
+    @staticmethod
+    async def disown_chat(update: Update, context: CallbackContext) -> None:
+        await Bot._set_owned_chat(update, owned=False)
+
+    @staticmethod
+    async def _set_owned_chat(update: Update, owned: bool) -> None:
+        if not update.message:
+            return
+
+        chat = update.message.chat
+        if chat.id >= 0:
+            await update.message.reply_text("Send this command in the group chat")
+            return
+
+        if not UserRepository.set_owned_chat(update.message.from_user.username, chat.id, owned):
+            await update.message.reply_text("Only moderators can own chats, use /set_moderator first")
+            return
+
+        if owned:
+            await update.message.reply_text(f"You will get personal notifications about {chat.title}")
+        else:
+            await update.message.reply_text(f"{chat.title} is removed from your chats")
+
+    @staticmethod
+    async def stats(update: Update, context: CallbackContext) -> None:
+        if not update.message:
+            return
+
+        msg: List[str] = update.message.text.split(" ")
+        days = 7
+        if len(msg) == 2:
+            days = int(msg[1]) if msg[1].isdecimal() and len(msg[1]) <= 4 else 0
+        if len(msg) > 2 or not 1 <= days <= STATS_MAX_DAYS:
+            await update.message.reply_text(f"The command is incorrect \n"
+                                            f"Correct from is - /stats 'days' (1 to {STATS_MAX_DAYS})")
+            return
+
+        report = await asyncio.to_thread(format_stats_report, days)
+        await update.message.reply_text(report)
+
+    @classmethod
+    async def get_bot_groups(cls, update: Update, context: CallbackContext) -> None:
+        """Command to retrieve all group chats the bot is in, one page at a time."""
+        page = page_cache.get(GROUPS)
+        await update.message.reply_text(page.text, reply_markup=page.reply_markup)
 
-        # Create a formatted list of groups
-        await update.message.reply_text(
-            f"Here are the groups I am in:\n\n{group_list}\n"
-        )
-    
     @staticmethod
     async def leave_group_chat(update: Update, context: CallbackContext) -> None:
         """Command to remove the bot from the current group chat."""
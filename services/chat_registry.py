@@ -0,0 +1,84 @@
+import threading
+
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+from schemas.records import ChatRecord
+from repositories.mongodb import ChatRepository
+from services.invalidation import invalidation_bus
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class ChatRegistry:
+    """
+    In-memory map of known group chats (chat_id -> title).
+    Warmed from the `chats` collection once, then a chat is written to Mongo
+    only when it is new or its title changed. Changes are broadcast through
+    the invalidation bus so the other processes see them too.
+    """
+
+    TOPIC = "chats"
+
+    def __init__(self) -> None:
+        self._names: Dict[int, Optional[str]] = {}
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._is_warm = False
+
+    def warm(self) -> None:
+        invalidation_bus.subscribe(self.TOPIC, self._on_invalidate)
+        names = ChatRepository.get_chat_names()
+        with self._lock:
+            self._names = names
+            self._ids = {name: chat_id for chat_id, name in names.items() if name}
+            self._is_warm = True
+        log.info("Chat registry is warmed with %s chats", len(names))
+
+    def ensure_warm(self) -> None:
+        if not self._is_warm:
+            self.warm()
+
+    def observe(self, chat: ChatRecord) -> Optional[UpdateOne]:
+        """
+        Register a chat seen in an update.
+        Returns the upsert to persist it or None when nothing changed.
+        """
+        if chat.chat_id >= 0:  # Group chats have negative ids
+            return None
+
+        with self._lock:
+            if chat.chat_id in self._names and self._names[chat.chat_id] == chat.name:
+                return None
+            self._set(chat.chat_id, chat.name)
+
+        invalidation_bus.publish(self.TOPIC, {"chat_id": chat.chat_id, "name": chat.name})
+        return ChatRepository.upsert_chat_op(chat)
+
+    def get_name(self, chat_id: int) -> Optional[str]:
+        self.ensure_warm()
+        return self._names.get(chat_id)
+
+    def get_chat_id(self, name: str) -> Optional[int]:
+        self.ensure_warm()
+        return self._ids.get(name)
+
+    def _on_invalidate(self, payload: dict) -> None:
+        chat_id = payload.get("chat_id")
+        if chat_id is None:
+            return
+        with self._lock:
+            self._set(chat_id, payload.get("name"))
+
+    def _set(self, chat_id: int, name: Optional[str]) -> None:
+        old_name = self._names.get(chat_id)
+        if old_name and self._ids.get(old_name) == chat_id:
+            del self._ids[old_name]
+        self._names[chat_id] = name
+        if name:
+            self._ids[name] = chat_id
+
+
+chat_registry = ChatRegistry()
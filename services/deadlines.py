@@ -0,0 +1,150 @@
+import asyncio
+import heapq
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from cfg.config import settings
+from schemas.records import MessageRecord
+from repositories.mongodb import ChatStateRepository
+from services.notifications import notify_moderators
+from services.reference_data import reference_data
+from services.rules import is_day_off, is_waiting_for_reply, is_work_time
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+def as_utc(date_time: datetime) -> datetime:
+    """ Mongo returns naive UTC datetimes, handlers produce aware ones """
+    if date_time.tzinfo is None:
+        return date_time.replace(tzinfo=timezone.utc)
+    return date_time.astimezone(timezone.utc)
+
+
+class DeadlineScheduler:
+    """
+    Per-chat reply timers of the bot process.
+    A timer is armed (or moved) when a message that needs a reply is
+    ingested and cancelled by any other message, e.g. a moderator's reply.
+    Timers live in a heap with lazy deletion; the current deadline of a chat
+    is also stored in chat_state.reply_deadline so it survives restarts.
+    """
+
+    def __init__(self, delay: timedelta) -> None:
+        self.delay = delay
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._firing: Set[asyncio.Task] = set()
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.is_running:
+            return
+
+        self._wakeup = asyncio.Event()
+        persisted = await asyncio.to_thread(ChatStateRepository.get_reply_deadlines)
+        for chat_id, deadline in persisted.items():
+            self._arm(chat_id, as_utc(deadline))
+        self._task = asyncio.create_task(self._run())
+        log.info("Deadline scheduler started with %s armed timers", len(persisted))
+
+    async def stop(self) -> None:
+        if not self.is_running:
+            return
+
+        self._task.cancel()
+        for task in self._firing:
+            task.cancel()
+        await asyncio.gather(self._task, *self._firing, return_exceptions=True)
+        self._task = None
+        self._firing.clear()
+
+    def on_message(self, msg: MessageRecord) -> Optional[datetime]:
+        """
+        Arm, refresh or cancel the timer of the message's chat.
+        Returns the deadline to persist in chat_state, None when cancelled.
+        """
+        if msg.name == settings.ADMINS_GROUP_CHAT_NAME:
+            return None
+
+        if is_waiting_for_reply(msg, reference_data.cached()):
+            deadline = as_utc(msg.created_at) + self.delay
+            self._arm(msg.chat_id, deadline)
+            return deadline
+
+        self._deadlines.pop(msg.chat_id, None)
+        return None
+
+    def _arm(self, chat_id: int, deadline: datetime) -> None:
+        self._deadlines[chat_id] = deadline
+        heapq.heappush(self._heap, (deadline.timestamp(), chat_id))
+
+        # Drop cancelled and refreshed timers once they dominate the heap
+        if len(self._heap) > 2 * len(self._deadlines) + 1000:
+            self._heap = [(dl.timestamp(), c_id) for c_id, dl in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+        if self._wakeup is not None and self._heap[0][1] == chat_id:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now(timezone.utc).timestamp()
+            while self._heap and self._heap[0][0] <= now:
+                timestamp, chat_id = heapq.heappop(self._heap)
+                deadline = self._deadlines.get(chat_id)
+                if deadline is None or deadline.timestamp() != timestamp:
+                    continue  # cancelled or refreshed
+                del self._deadlines[chat_id]
+                # A slow send (retries, flood waits) must not hold back the other timers
+                task = asyncio.create_task(self._fire_safely(chat_id, deadline))
+                self._firing.add(task)
+                task.add_done_callback(self._firing.discard)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire_safely(self, chat_id: int, deadline: datetime) -> None:
+        try:
+            await self._fire(chat_id, deadline)
+        except Exception as e:
+            log.warning("Deadline of chat %s failed: %s", chat_id, e)
+
+    async def _fire(self, chat_id: int, deadline: datetime) -> None:
+        state = await asyncio.to_thread(ChatStateRepository.get_state, chat_id)
+        ref = reference_data.cached()
+        if (
+                state is not None
+                and not state.is_notified
+                and is_work_time()
+                and not is_day_off()
+                and is_waiting_for_reply(state, ref)
+        ):
+            # The checker may have sent the first alert already
+            tier = await asyncio.to_thread(
+                ChatStateRepository.claim_alert, chat_id, state.created_at,
+                datetime.now(timezone.utc), ChatStateRepository.ALERT_FIRST
+            )
+            if tier is not None:
+                # Routed like the checker's alerts, see NOTIFICATION_FANOUT
+                await notify_moderators(ref.admins_chat_id, [{
+                    "chat_id": state.chat_id,
+                    "username": state.username,
+                    "name": state.name,
+                    "tier": tier,
+                }])
+
+        await asyncio.to_thread(ChatStateRepository.clear_reply_deadline, chat_id, deadline)
+
+
+deadline_scheduler = DeadlineScheduler(delay=timedelta(minutes=settings.REPLY_DEADLINE_MINUTES))
@@ -0,0 +1,70 @@
+import json
+import threading
+
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from redis.exceptions import RedisError
+
+from cfg.cache import redis_client
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class InvalidationBus:
+    """
+    Tiny Redis pub/sub bus used to keep in-process caches of the bot and
+    of the Celery workers in sync. Every process listens on all topics in
+    one daemon thread started on the first subscription.
+    """
+
+    CHANNEL_PREFIX = "invalidate:"
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, topic: str, payload: dict) -> None:
+        try:
+            redis_client.publish(self.CHANNEL_PREFIX + topic, json.dumps(payload))
+        except RedisError as e:
+            log.info("Invalidation publish error (%s): %s", topic, e)
+
+    def subscribe(self, topic: str, handler: Callable[[dict], None]) -> None:
+        with self._lock:
+            if handler not in self._handlers[topic]:
+                self._handlers[topic].append(handler)
+            self._ensure_listener()
+
+    def _ensure_listener(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{self.CHANNEL_PREFIX + "*": self._dispatch})
+        self._thread = pubsub.run_in_thread(
+            sleep_time=1, daemon=True,
+            exception_handler=self._on_error
+        )
+
+    def _dispatch(self, message: dict) -> None:
+        topic = message["channel"][len(self.CHANNEL_PREFIX):]
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError):
+            payload = {}
+
+        for handler in list(self._handlers.get(topic, [])):
+            try:
+                handler(payload)
+            except Exception as e:
+                log.info("Invalidation handler error (%s): %s", topic, e)
+
+    @staticmethod
+    def _on_error(e: Exception, pubsub, thread) -> None:
+        log.info("Invalidation listener error: %s", e)
+
+
+invalidation_bus = InvalidationBus()
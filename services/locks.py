@@ -0,0 +1,25 @@
+from typing import Optional
+from uuid import uuid4
+
+from cfg.cache import redis_client
+
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_lock(name: str, ttl: int) -> Optional[str]:
+    """ Returns the lock token, None when the lock is held by someone else """
+    token = uuid4().hex
+    if redis_client.set(f"lock:{name}", token, nx=True, ex=ttl):
+        return token
+    return None
+
+
+def release_lock(name: str, token: str) -> None:
+    """ Release the lock only if it is still ours """
+    redis_client.eval(RELEASE_SCRIPT, 1, f"lock:{name}", token)
@@ -0,0 +1,114 @@
+import asyncio
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from cfg.config import settings
+from schemas.records import MessageRecord
+from repositories.mongodb import ChatStateRepository, UserRepository
+from services.outbound import outbound
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+HEADERS = {
+    ChatStateRepository.ALERT_FIRST: "These are the advertisers that are waiting for a reply:",
+    ChatStateRepository.ALERT_REMINDER: "Reminder, these advertisers are still waiting for a reply:",
+    ChatStateRepository.ALERT_ESCALATION: "Nobody has replied to these advertisers yet:",
+}
+
+
+def format_advertisers(advertisers: Iterable[Dict], tier: int = ChatStateRepository.ALERT_FIRST) -> str:
+    return (
+        HEADERS[tier] + "\n" +
+        "\n".join(f"- {adv['name']} - @{adv['username']}" for adv in advertisers)
+    )
+
+
+def claim_alerts(advertisers: List[Dict], last_messages: Iterable[MessageRecord], now: datetime) -> List[Dict]:
+    """
+    Keep the advertisers whose next alert tier is due, with that tier
+    under "tier". Chats already alerted about their last message are
+    dropped until a reminder is due or a new message resets them.
+    """
+    created_at = {msg.chat_id: msg.created_at for msg in last_messages}
+    claimed = []
+    for adv in advertisers:
+        tier = ChatStateRepository.claim_alert(adv["chat_id"], created_at[adv["chat_id"]], now)
+        if tier is not None:
+            claimed.append({**adv, "tier": tier})
+    return claimed
+
+
+def personal_notifications(
+        advertisers: List[Dict],
+        recipients: List[Dict],
+        tier: int = ChatStateRepository.ALERT_FIRST,
+) -> List[Tuple[int, str]]:
+    """
+    (chat_id, text) for every recipient with something to read: moderators
+    that own chats only hear about those, the others about all of them.
+    """
+    notifications = []
+    for recipient in recipients:
+        owned_chats = set(recipient.get("owned_chats") or ())
+        scoped = [adv for adv in advertisers if not owned_chats or adv["chat_id"] in owned_chats]
+        if scoped:
+            notifications.append((recipient["chat_id"], format_advertisers(scoped, tier)))
+    return notifications
+
+
+async def fan_out(notifications: List[Tuple[int, str]], concurrency: int) -> int:
+    """
+    Send all notifications concurrently, at most `concurrency` in flight.
+    A failed recipient does not stop the others. Returns the number delivered.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(chat_id: int, text: str) -> None:
+        async with semaphore:
+            await outbound.send(chat_id, text)
+
+    results = await asyncio.gather(
+        *(deliver(chat_id, text) for chat_id, text in notifications),
+        return_exceptions=True
+    )
+    for (chat_id, _), result in zip(notifications, results):
+        if isinstance(result, BaseException):
+            log.warning("Personal notification to %s failed: %s", chat_id, result)
+    return sum(1 for result in results if not isinstance(result, BaseException))
+
+
+async def notify_moderators(admins_chat_id: int, advertisers: List[Dict]) -> None:
+    """
+    One message per alert tier ("tier" of each advertiser). First alerts and
+    reminders go to the admins group and / or each moderator, see
+    NOTIFICATION_FANOUT; escalations always go to each moderator. Alerts
+    nobody can receive personally go to the admins group instead.
+    """
+    tiers: Dict[int, List[Dict]] = {}
+    for adv in advertisers:
+        tiers.setdefault(adv.get("tier", ChatStateRepository.ALERT_FIRST), []).append(adv)
+
+    notifications = []
+    recipients = None
+    for tier, tier_advertisers in sorted(tiers.items()):
+        escalation = tier == ChatStateRepository.ALERT_ESCALATION
+        to_group = not escalation and settings.NOTIFICATION_FANOUT in ("group", "both")
+        personal = []
+        if escalation or settings.NOTIFICATION_FANOUT in ("personal", "both"):
+            if recipients is None:
+                recipients = await asyncio.to_thread(UserRepository.get_notification_recipients)
+            personal = personal_notifications(tier_advertisers, recipients, tier)
+            if not personal and not to_group:
+                # e.g. moderators registered from a group chat, the alert must not get lost
+                log.warning("No personal recipients for %s alerts, notifying the admins group", len(tier_advertisers))
+                to_group = True
+
+        if to_group:
+            notifications.append((admins_chat_id, format_advertisers(tier_advertisers, tier)))
+        notifications.extend(personal)
+
+    delivered = await fan_out(notifications, settings.NOTIFICATION_FANOUT_CONCURRENCY)
+    log.info("Notifications delivered: %s of %s", delivered, len(notifications))
@@ -0,0 +1,283 @@
+import asyncio
+import random
+import time
+
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, List, Optional, Set
+
+from telegram import Bot as TGBot
+from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+from cfg.config import settings
+from utils.logs import get_logger
+from utils.metrics import registry, telegram_send_duration, telegram_sends
+
+log = get_logger(__name__)
+
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class OutgoingMessage:
+    __slots__ = ("chat_id", "text", "futures", "enqueued_at")
+
+    def __init__(self, chat_id: int, text: str, future: asyncio.Future) -> None:
+        self.chat_id = chat_id
+        self.text = text
+        self.futures: List[asyncio.Future] = [future]
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundSender:
+    """
+    Long-lived Telegram client (one pooled HTTP connection set per event
+    loop) behind a send queue that follows Telegram's flood limits:
+    a global messages-per-second budget, one message per `chat_interval`
+    to a private chat and per `group_interval` to a group.
+    Messages queued for the same chat are coalesced into one send while
+    they fit into 4096 characters. Failed sends are retried with
+    exponential backoff and jitter, 429 responses wait for `retry_after`.
+    A sender waits at most `send_timeout` seconds; when the client cannot
+    be initialized (e.g. invalid token) every queued send fails.
+    """
+
+    INIT_ATTEMPTS = 5
+    INIT_RETRY_DELAY = 5
+
+    def __init__(
+            self,
+            global_rate: float,
+            chat_interval: float,
+            group_interval: float,
+            concurrency: int,
+            max_attempts: int,
+            send_timeout: float,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.send_timeout = send_timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bot: Optional[TGBot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pending: Dict[int, Deque[OutgoingMessage]] = {}
+        self._in_flight: Set[int] = set()
+        self._next_allowed: Dict[int, float] = {}
+        self._tokens = 0.0
+        self._tokens_at = 0.0
+
+        # metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    async def send(self, chat_id: int, text: str) -> None:
+        """
+        Queue a message and wait until it is delivered (or failed).
+        Raises asyncio.TimeoutError after `send_timeout` seconds.
+        """
+        self._ensure_started()
+
+        future = self._loop.create_future()
+        pending = self._pending.setdefault(chat_id, deque())
+        if pending and len(pending[-1].text) + 2 + len(text) <= MAX_MESSAGE_LENGTH:
+            pending[-1].text += "\n\n" + text
+            pending[-1].futures.append(future)
+        else:
+            pending.append(OutgoingMessage(chat_id, text, future))
+
+        self._wakeup.set()
+        await asyncio.wait_for(future, self.send_timeout)
+
+    async def stop(self, timeout: float = 10) -> None:
+        """ Wait for the queue to drain and close the HTTP connections """
+        if self._task is None:
+            return
+
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self._bot.shutdown()
+        self._task = None
+        self._bot = None
+        self._loop = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+
+        # The HTTP client is bound to an event loop, a new loop needs a new one
+        self._loop = loop
+        self._bot = TGBot(
+            token=settings.TG_TOKEN,
+            request=HTTPXRequest(
+                connection_pool_size=self.concurrency,
+                connect_timeout=10,
+                read_timeout=15,
+                pool_timeout=5,
+            ),
+        )
+        self._pending = {}
+        self._in_flight = set()
+        self._wakeup = asyncio.Event()
+        self._tokens = self.global_rate
+        self._tokens_at = time.monotonic()
+        self._task = loop.create_task(self._run())
+
+    async def _initialize(self) -> bool:
+        for attempt in range(1, self.INIT_ATTEMPTS + 1):
+            try:
+                await self._bot.initialize()
+                return True
+            except (InvalidToken, Forbidden) as e:  # will not succeed on retry
+                error = e
+                break
+            except TelegramError as e:
+                error = e
+                log.info("Telegram client initialization failed (attempt %s): %s", attempt, e)
+                if attempt < self.INIT_ATTEMPTS:
+                    await asyncio.sleep(self.INIT_RETRY_DELAY)
+
+        log.error("Telegram client cannot be initialized: %s", error)
+        self._fail_pending(error)
+        return False
+
+    def _fail_pending(self, error: Exception) -> None:
+        """ Fail every queued send, the next send starts a new client """
+        for pending in self._pending.values():
+            for message in pending:
+                self.failed += 1
+                telegram_sends.inc("failed")
+                for future in message.futures:
+                    if not future.done():
+                        future.set_exception(error)
+        self._pending = {}
+
+    async def _run(self) -> None:
+        if not await self._initialize():
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            now = time.monotonic()
+            wait: Optional[float] = None
+
+            for chat_id in list(self._pending):
+                if chat_id in self._in_flight:
+                    continue
+
+                not_before = self._next_allowed.get(chat_id, 0)
+                if not_before > now:
+                    wait = min(wait, not_before - now) if wait is not None else not_before - now
+                    continue
+
+                token_wait = self._take_token(now)
+                if token_wait > 0:
+                    wait = min(wait, token_wait) if wait is not None else token_wait
+                    break
+
+                message = self._pending[chat_id].popleft()
+                if not self._pending[chat_id]:
+                    del self._pending[chat_id]
+                self._in_flight.add(chat_id)
+                await semaphore.acquire()
+                task = asyncio.create_task(self._deliver(message))
+                task.add_done_callback(lambda _: semaphore.release())
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _take_token(self, now: float) -> float:
+        """ Global token bucket, returns seconds to wait for a token """
+        self._tokens = min(self.global_rate, self._tokens + (now - self._tokens_at) * self.global_rate)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.global_rate
+
+    async def _deliver(self, message: OutgoingMessage) -> None:
+        chat_id = message.chat_id
+        interval = self.group_interval if chat_id < 0 else self.chat_interval
+        error: Optional[Exception] = None
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    await self._bot.send_message(chat_id=chat_id, text=message.text)
+                    error = None
+                    break
+                except RetryAfter as e:
+                    error = e
+                    retry_after = e.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    delay = float(retry_after) + random.uniform(0, 1)
+                except (BadRequest, Forbidden) as e:  # will not succeed on retry
+                    error = e
+                    break
+                except (NetworkError, TelegramError) as e:
+                    error = e
+                    delay = min(60.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+                if attempt < self.max_attempts:
+                    self.retried += 1
+                    telegram_sends.inc("retried")
+                    log.info("Send to %s failed (%s), retrying in %.1fs", chat_id, error, delay)
+                    await asyncio.sleep(delay)
+        finally:
+            self._in_flight.discard(chat_id)
+            self._next_allowed[chat_id] = time.monotonic() + interval
+            self._wakeup.set()
+
+        latency = time.monotonic() - message.enqueued_at
+        if error is None:
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            telegram_send_duration.observe(latency)
+            telegram_sends.inc("sent")
+        else:
+            self.failed += 1
+            telegram_sends.inc("failed")
+            log.warning("Send to %s failed: %s", chat_id, error)
+
+        for future in message.futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+outbound = OutboundSender(
+    global_rate=settings.OUTBOUND_GLOBAL_RATE,
+    chat_interval=settings.OUTBOUND_CHAT_INTERVAL,
+    group_interval=settings.OUTBOUND_GROUP_INTERVAL,
+    concurrency=settings.OUTBOUND_CONCURRENCY,
+    max_attempts=settings.OUTBOUND_MAX_ATTEMPTS,
+    send_timeout=settings.OUTBOUND_SEND_TIMEOUT,
+)
+registry.gauge("telegram_send_queue_depth", "Messages waiting to be sent", lambda: outbound.queue_depth)
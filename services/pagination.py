@@ -0,0 +1,117 @@
+import time
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from cfg.config import settings
+from repositories.mongodb import ChatRepository, UserRepository
+
+
+GROUPS = "get_bot_groups"
+MODERATORS = "get_all_moderators"
+
+NEXT = ">"
+PREV = "<"
+
+
+class Page(NamedTuple):
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup]
+
+
+class PageSource(NamedTuple):
+    title: str
+    empty: str
+    field: str
+    parse_cursor: Callable[[str], object]
+    load: Callable[..., Tuple[List[Dict], bool, bool]]
+    render: Callable[[Dict], str]
+
+
+SOURCES: Dict[str, PageSource] = {
+    GROUPS: PageSource(
+        title="Here are the groups I am in:",
+        empty="I am not in any group chats!",
+        field="chat_id",
+        parse_cursor=int,
+        load=ChatRepository.get_group_chats_page,
+        render=lambda chat: chat.get("name") or str(chat["chat_id"]),
+    ),
+    MODERATORS: PageSource(
+        title="Moderators:",
+        empty="There are no moderators yet",
+        field="username",
+        parse_cursor=str,
+        load=UserRepository.get_moderators_page,
+        render=lambda user: f"@{user['username']}",
+    ),
+}
+
+
+def page_callback_data(kind: str, direction: str, cursor) -> str:
+    """ "get_bot_groups:>:-100123" - well below the 64 bytes Telegram allows """
+    return f"{kind}:{direction}:{cursor}"
+
+
+def parse_page_callback(data: str) -> Optional[Tuple[str, str, str]]:
+    kind, sep, rest = data.partition(":")
+    direction, sep2, cursor = rest.partition(":")
+    if not sep or not sep2 or kind not in SOURCES or direction not in (NEXT, PREV):
+        return None
+    return kind, direction, cursor
+
+
+class PageCache:
+    """
+    Rendered pages keyed by (kind, direction, cursor) for `ttl` seconds,
+    so paging back and forth does not query Mongo on every tap.
+    """
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self._pages: Dict[Tuple[str, str, str], Tuple[float, Page]] = {}
+
+    def get(self, kind: str, direction: str = NEXT, cursor: str = "") -> Page:
+        key = (kind, direction, cursor)
+        cached = self._pages.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+
+        page = self._render(kind, direction, cursor)
+        if len(self._pages) > 1000:
+            self._pages = {k: v for k, v in self._pages.items() if now - v[0] < self.ttl}
+        self._pages[key] = (now, page)
+        return page
+
+    def invalidate(self, kind: str) -> None:
+        self._pages = {k: v for k, v in self._pages.items() if k[0] != kind}
+
+    @staticmethod
+    def _render(kind: str, direction: str, cursor: str) -> Page:
+        source = SOURCES[kind]
+        position = source.parse_cursor(cursor) if cursor else None
+        if direction == PREV:
+            docs, has_prev, has_next = source.load(settings.PAGE_SIZE, before=position)
+        else:
+            docs, has_prev, has_next = source.load(settings.PAGE_SIZE, after=position)
+
+        if not docs:
+            return Page(source.empty, None)
+
+        buttons = []
+        if has_prev:
+            buttons.append(InlineKeyboardButton(
+                "« Prev", callback_data=page_callback_data(kind, PREV, docs[0][source.field])
+            ))
+        if has_next:
+            buttons.append(InlineKeyboardButton(
+                "Next »", callback_data=page_callback_data(kind, NEXT, docs[-1][source.field])
+            ))
+
+        text = source.title + "\n\n" + "\n".join(source.render(doc) for doc in docs)
+        return Page(text, InlineKeyboardMarkup([buttons]) if buttons else None)
+
+
+page_cache = PageCache(ttl=settings.PAGE_CACHE_SECONDS)
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+from cfg.config import settings
+from repositories.mongodb import (
+    ChatRepository, UserRepository,
+    IgnoredUserRepository, NotificationRuleRepository
+)
+from services.chat_registry import chat_registry
+from services.invalidation import invalidation_bus
+from services.rules import CompiledRules, compile_rules, default_rules, parse_rules
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    moderators: FrozenSet[str]
+    ignored_users: FrozenSet[str]
+    admins_chat_id: int
+    rules: CompiledRules
+    loaded_at: float
+
+
+class ReferenceDataCache:
+    """
+    Process-wide snapshot of the rarely changing data the checker needs,
+    including the compiled notification rules.
+    Reloaded after `ttl` seconds or when /set_moderator, /ignore or
+    /ignore_phrase publish an invalidation, which reaches the bot and every
+    Celery worker.
+    `get` reloads in the calling thread (Celery tasks); the bot's handlers
+    use `cached`, which never blocks the event loop.
+    """
+
+    TOPIC = "reference_data"
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self._snapshot: Optional[ReferenceData] = None
+        self._invalidated = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, snapshot: Optional[ReferenceData]) -> bool:
+        return (
+            snapshot is not None
+            and not self._invalidated
+            and time.monotonic() - snapshot.loaded_at < self.ttl
+        )
+
+    def get(self) -> ReferenceData:
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if not self._is_fresh(snapshot):
+                self._invalidated = False  # an invalidation during the load triggers another one
+                snapshot = self._load()
+                self._snapshot = snapshot
+        return snapshot
+
+    def cached(self) -> ReferenceData:
+        """
+        The current snapshot, even when stale, for the event loop: a stale
+        one is reloaded in a background thread. Only loads in the calling
+        thread when nothing was loaded yet (the bot warms it on startup).
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.get()
+
+        if not self._is_fresh(snapshot) and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name="reference-data-refresh", daemon=True).start()
+        return snapshot
+
+    def _refresh(self) -> None:
+        try:
+            self.get()
+        except Exception as e:  # the stale snapshot is kept, retried on the next read
+            log.warning("Reference data refresh failed: %s", e)
+        finally:
+            self._refreshing = False
+
+    def invalidate(self) -> None:
+        """ Mark the snapshot stale here and in all other processes """
+        self._invalidated = True
+        invalidation_bus.publish(self.TOPIC, {})
+
+    def _on_invalidate(self, payload: dict) -> None:
+        self._invalidated = True
+
+    def _load(self) -> ReferenceData:
+        invalidation_bus.subscribe(self.TOPIC, self._on_invalidate)
+
+        admins_chat_id = chat_registry.get_chat_id(settings.ADMINS_GROUP_CHAT_NAME)
+        if admins_chat_id is None:
+            admins_chat_id = ChatRepository.get_admins_chat_id()
+
+        snapshot = ReferenceData(
+            moderators=frozenset(UserRepository.get_moderator_usernames()),
+            ignored_users=frozenset(IgnoredUserRepository.get_ignored_usernames()),
+            admins_chat_id=admins_chat_id,
+            rules=compile_rules(default_rules() + parse_rules(NotificationRuleRepository.get_rules())),
+            loaded_at=time.monotonic(),
+        )
+        log.info(
+            "Reference data loaded: %s moderators, %s ignored users",
+            len(snapshot.moderators), len(snapshot.ignored_users)
+        )
+        return snapshot
+
+
+reference_data = ReferenceDataCache(ttl=settings.REFERENCE_DATA_TTL_SECONDS)
@@ -0,0 +1,101 @@
+import time
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from cfg.config import settings
+from repositories.mongodb import JobStateRepository, MessageRepository, MessageRollupRepository
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+ROLLUP_JOB = "message_rollup"
+PURGE_JOB = "message_purge"
+
+
+def utc_today() -> datetime:
+    """ Midnight of the current UTC day, naive like the datetimes pymongo returns """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return datetime.combine(now.date(), datetime.min.time())
+
+
+def day_start(date_time: datetime) -> datetime:
+    return datetime.combine(date_time.date(), datetime.min.time())
+
+
+def rollup_finished_days() -> int:
+    """
+    Roll up every finished day since the last run, yesterday when the job
+    runs daily. The first run starts at the oldest stored message, so the
+    existing history is rolled up before the TTL index deletes it.
+    Days that may already be partly expired are skipped.
+    """
+    yesterday = utc_today() - timedelta(days=1)
+    last_day: Optional[datetime] = JobStateRepository.get_checkpoint(ROLLUP_JOB)
+    if last_day:
+        day = last_day + timedelta(days=1)
+    else:
+        oldest = MessageRepository.get_oldest_message_date()
+        day = day_start(oldest) if oldest else yesterday
+    if settings.MESSAGE_RETENTION_DAYS > 0:
+        day = max(day, utc_today() - timedelta(days=MessageRepository.TTL_DAYS - 1))
+    return rollup_days(day, yesterday)
+
+
+def rollup_days(day: datetime, last_day: datetime) -> int:
+    """ Roll up the days from `day` to `last_day`, checkpointing each one for the daily job """
+    days = 0
+    while day <= last_day:
+        MessageRollupRepository.rollup_day(day)
+        JobStateRepository.set_checkpoint(ROLLUP_JOB, day)
+        log.info("Messages of %s are rolled up", day.date())
+        day += timedelta(days=1)
+        days += 1
+    return days
+
+
+def purge_messages(older_than_days: int, batch_size: int, pause: float) -> int:
+    """
+    Roll up and delete, day by day from the oldest one, the messages older
+    than `older_than_days` full days. Deletes in batches with a pause between
+    them. The last rolled up day is checkpointed before its deletion starts,
+    so an interrupted purge resumes without recomputing a partial rollup.
+    The kept days up to yesterday are then rolled up too, the daily job
+    continues from there: no day falls between the purge and the TTL.
+    """
+    cutoff = utc_today() - timedelta(days=older_than_days)
+    oldest = MessageRepository.get_oldest_message_date()
+    if oldest is None or oldest >= cutoff:
+        log.info("Nothing to purge")
+        return 0
+
+    rolled_up: Optional[datetime] = JobStateRepository.get_checkpoint(PURGE_JOB)
+    deleted = 0
+    day = day_start(oldest)
+    while day < cutoff:
+        if rolled_up is None or day > rolled_up:
+            MessageRollupRepository.rollup_day(day)
+            JobStateRepository.set_checkpoint(PURGE_JOB, day)
+            rolled_up = day
+
+        day_deleted = 0
+        while True:
+            count = MessageRepository.delete_older_than(day + timedelta(days=1), batch_size)
+            day_deleted += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+
+        deleted += day_deleted
+        log.info("Purged %s messages of %s, %s in total", day_deleted, day.date(), deleted)
+        day += timedelta(days=1)
+
+    rollup_kept_days(cutoff)
+    return deleted
+
+
+def rollup_kept_days(cutoff: datetime) -> None:
+    last_day: Optional[datetime] = JobStateRepository.get_checkpoint(ROLLUP_JOB)
+    day = max(cutoff, last_day + timedelta(days=1)) if last_day else cutoff
+    rollup_days(day, utc_today() - timedelta(days=1))
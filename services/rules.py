@@ -0,0 +1,187 @@
+import re
+
+from zoneinfo import ZoneInfo
+from datetime import datetime, time
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Pattern
+
+from pydantic import ValidationError
+
+from cfg.config import settings
+from schemas.records import MessageRecord
+from schemas.rules import NotificationRuleSchema
+from utils.logs import get_logger
+
+if TYPE_CHECKING:
+    from services.reference_data import ReferenceData
+
+log = get_logger(__name__)
+
+NAME_FIELDS = ("first_name", "last_name")
+
+
+class CompiledRules:
+    """
+    Notification rules compiled into set lookups and one combined regex per
+    name field, so evaluating a message does not depend on the rule count.
+    """
+
+    def __init__(
+            self,
+            ignore_phrases: FrozenSet[str],
+            name_patterns: Dict[str, Optional[Pattern]],
+            skip_chats: FrozenSet[str],
+    ) -> None:
+        self.ignore_phrases = ignore_phrases
+        self.name_patterns = name_patterns
+        self.skip_chats = skip_chats
+
+    def matches_name(self, msg: MessageRecord) -> bool:
+        """ Whether the sender's name matches an ignore_name rule (our staff) """
+        for field in NAME_FIELDS:
+            pattern = self.name_patterns.get(field)
+            value = getattr(msg, field)
+            if pattern is not None and value and pattern.search(value):
+                return True
+        return False
+
+    def is_waiting_for_reply(
+            self,
+            msg: MessageRecord,
+            moderators: FrozenSet[str],
+            ignored_users: FrozenSet[str],
+    ) -> bool:
+        if msg.username in moderators or msg.username in ignored_users:
+            return False
+
+        if msg.name in self.skip_chats or str(msg.chat_id) in self.skip_chats:
+            return False
+
+        message = msg.message.lower() if msg.message else ''
+        if message in self.ignore_phrases:
+            return False
+
+        if self.matches_name(msg):
+            return False
+
+        return True
+
+
+def combine_patterns(patterns: Iterable[str]) -> Optional[Pattern]:
+    """
+    One case-insensitive regex matching any of the patterns. A pattern that
+    is valid alone may not be once joined (e.g. inline flags, duplicated
+    group names), so every one is checked against the combined regex.
+    """
+    accepted: List[str] = []
+    for pattern in patterns:
+        try:
+            re.compile("|".join(f"(?:{p})" for p in accepted + [pattern]), re.IGNORECASE)
+        except re.error as e:
+            log.info("Invalid name pattern %r is skipped: %s", pattern, e)
+            continue
+        accepted.append(pattern)
+
+    if not accepted:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in accepted), re.IGNORECASE)
+
+
+def compile_rules(rules: Iterable[NotificationRuleSchema]) -> CompiledRules:
+    ignore_phrases = set()
+    skip_chats = set()
+    name_patterns: Dict[str, List[str]] = {field: [] for field in NAME_FIELDS}
+
+    for rule in rules:
+        if not rule.value.strip():
+            # e.g. an empty name pattern would match every name
+            log.info("Empty notification rule is skipped: %s", rule)
+        elif rule.type == "ignore_phrase":
+            ignore_phrases.add(rule.value.strip().lower())
+        elif rule.type == "skip_chat":
+            skip_chats.add(rule.value.strip())
+        elif rule.type == "ignore_name" and rule.field in name_patterns:
+            name_patterns[rule.field].append(rule.value)
+        else:
+            log.info("Unknown notification rule is skipped: %s", rule)
+
+    return CompiledRules(
+        ignore_phrases=frozenset(ignore_phrases),
+        name_patterns={field: combine_patterns(patterns) for field, patterns in name_patterns.items()},
+        skip_chats=frozenset(skip_chats),
+    )
+
+
+def default_rules() -> List[NotificationRuleSchema]:
+    """ Rules from the config, the ones stored in Mongo are added to them """
+    rules = [NotificationRuleSchema(type="ignore_phrase", value=phrase) for phrase in settings.IGNORE_PHRASES]
+    rules += [
+        NotificationRuleSchema(type="ignore_name", field="first_name", value=pattern)
+        for pattern in settings.IGNORE_FIRST_NAME_PATTERNS
+    ]
+    rules += [
+        NotificationRuleSchema(type="ignore_name", field="last_name", value=pattern)
+        for pattern in settings.IGNORE_LAST_NAME_PATTERNS
+    ]
+    return rules
+
+
+def parse_rules(documents: Iterable[Dict]) -> List[NotificationRuleSchema]:
+    rules = []
+    for doc in documents:
+        try:
+            rules.append(NotificationRuleSchema(**doc))
+        except ValidationError as e:
+            log.info("Invalid notification rule %s is skipped: %s", doc, e)
+    return rules
+
+
+def is_waiting_for_reply(msg: MessageRecord, ref: "ReferenceData") -> bool:
+    """ Whether the last message of a chat needs a reply from a moderator """
+    return ref.rules.is_waiting_for_reply(msg, ref.moderators, ref.ignored_users)
+
+
+def is_moderator_reply(msg: MessageRecord, ref: "ReferenceData") -> bool:
+    """ Whether the message was sent by a moderator or by our staff """
+    return msg.username in ref.moderators or ref.rules.matches_name(msg)
+
+
+def find_waiting_advertisers(
+        last_messages: Iterable[MessageRecord],
+        ref: "ReferenceData",
+        older_than: datetime,
+) -> List[Dict]:
+    """ Chats whose last message, sent before `older_than`, still needs a reply """
+    advertisers = {}
+    for last_message in last_messages:
+        if (
+                # Check if message was created 15 minute ago
+                (last_message.created_at < older_than)
+                and (last_message.name not in advertisers)
+                and is_waiting_for_reply(last_message, ref)
+        ):
+            advertisers[last_message.name] = {
+                "chat_id": last_message.chat_id,
+                "username": last_message.username,
+                "name": last_message.name,
+            }
+    return list(advertisers.values())
+
+
+def is_work_time() -> bool:
+    utc_date_time = datetime.now()
+
+    gmt_plus_3 = ZoneInfo('Etc/GMT-3')  # 'Etc/GMT-3' corresponds to GMT+3
+    local_date_time = utc_date_time.astimezone(gmt_plus_3)
+    current_time = local_date_time.time()
+
+    start_time = time(22, 0)  # 22:00 PM
+    end_time = time(8, 0)  # 08:00 AM
+
+    # Check if current time is within the range
+    if start_time <= current_time or current_time <= end_time:
+        return False
+    return True
+
+
+def is_day_off() -> bool:
+    return datetime.today().weekday() == 5  # Saturday
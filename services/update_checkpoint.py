@@ -0,0 +1,70 @@
+import asyncio
+
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CallbackContext
+
+from repositories.mongodb import JobStateRepository
+from services.write_behind import write_behind
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+UPDATES_JOB = "telegram_updates"
+
+
+class UpdateCheckpoint:
+    """
+    Highest processed update_id, persisted in job_state through the
+    write-behind queue. After a restart Telegram re-delivers, oldest first,
+    the updates it has not seen confirmed; the ones at or just below the
+    checkpoint loaded on startup are dropped before any handler runs.
+    Replays are harmless anyway (messages are upserted on their natural
+    key), the filter only saves the work.
+    """
+
+    # Telegram starts over from a random update_id after a week without
+    # updates or with a new bot token: ids further below are not replays
+    REPLAY_WINDOW = 100_000
+
+    def __init__(self) -> None:
+        self.last_update_id: Optional[int] = None
+
+    def load(self) -> None:
+        self.last_update_id = JobStateRepository.get_checkpoint(UPDATES_JOB)
+        log.info("Update checkpoint loaded: %s", self.last_update_id)
+
+    async def drop_replayed(self, update: Update, context: CallbackContext) -> None:
+        """ Handler of group -1, stops the processing of replayed updates """
+        if self.last_update_id is None:
+            return
+
+        if update.update_id > self.last_update_id:
+            self.last_update_id = None  # replays come first, nothing more to drop
+        elif update.update_id < self.last_update_id - self.REPLAY_WINDOW:
+            log.warning(
+                "Update ids started over at %s (checkpoint %s), resetting the checkpoint",
+                update.update_id, self.last_update_id
+            )
+            self.last_update_id = None
+            # advance() only moves the checkpoint forward
+            await asyncio.to_thread(JobStateRepository.set_checkpoint, UPDATES_JOB, update.update_id)
+        else:
+            log.debug("Replayed update %s is dropped", update.update_id)
+            raise ApplicationHandlerStop
+
+    async def advance(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handler of the last group, runs once the update has been handled.
+        Written only after the flush of the update's own writes succeeded.
+        """
+        await write_behind.put(
+            JobStateRepository.db,
+            JobStateRepository.advance_checkpoint_op(UPDATES_JOB, update.update_id),
+            checkpoint=True
+        )
+
+
+update_checkpoint = UpdateCheckpoint()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import signal
+
+from typing import List
+
+from telegram import Update
+from telegram.ext import Application
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication, RequestHandler
+
+from cfg.config import settings
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+LOOPBACK_ADDRESSES = ("127.0.0.1", "::1", "localhost")
+
+
+def validate_webhook_settings() -> None:
+    """
+    Without a secret token anyone reaching the port could post updates
+    (fake moderator replies, /set_moderator): only allowed for a local
+    server that is not registered at Telegram.
+    """
+    if settings.WEBHOOK_SECRET_TOKEN:
+        return
+    if settings.WEBHOOK_URL or settings.WEBHOOK_LISTEN not in LOOPBACK_ADDRESSES:
+        raise SystemExit(
+            "WEBHOOK_SECRET_TOKEN must be set to run the webhook, "
+            "unless it listens on a loopback address without WEBHOOK_URL"
+        )
+
+
+class TelegramWebhookHandler(RequestHandler):
+    """ Receives updates pushed by Telegram and feeds them to the bot """
+
+    def initialize(self, app: Application) -> None:
+        self.app = app
+
+    async def post(self) -> None:
+        secret_token = settings.WEBHOOK_SECRET_TOKEN
+        if secret_token and self.request.headers.get(SECRET_TOKEN_HEADER) != secret_token:
+            log.info("Webhook request with a wrong secret token")
+            self.set_status(403)
+            return
+
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.app.bot)
+        except (TypeError, ValueError, KeyError) as e:
+            log.info("Webhook request with an invalid update: %s", e)
+            self.set_status(400)
+            return
+
+        await self.app.update_queue.put(update)
+        self.set_status(200)
+
+
+async def run_webhook(app: Application, allowed_updates: List[str]) -> None:
+    """
+    Serve the bot over a webhook instead of long polling.
+    The webhook is registered at Telegram only when WEBHOOK_URL is set, so
+    the server can be run locally and fed with recorded updates
+    (see scripts/post_update.py).
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    url_path = f"/{settings.WEBHOOK_PATH.strip('/')}"
+    web_app = WebApplication([(url_path, TelegramWebhookHandler, {"app": app})])
+    server = HTTPServer(web_app, xheaders=True)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    try:
+        if settings.WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=settings.WEBHOOK_URL.rstrip("/") + url_path,
+                secret_token=settings.WEBHOOK_SECRET_TOKEN or None,
+                allowed_updates=allowed_updates,
+                max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            )
+            log.info("Webhook is registered at %s", settings.WEBHOOK_URL)
+
+        await app.start()
+        server.listen(settings.WEBHOOK_PORT, address=settings.WEBHOOK_LISTEN)
+        log.info(
+            "Webhook server is listening on %s:%s%s", settings.WEBHOOK_LISTEN, settings.WEBHOOK_PORT, url_path
+        )
+        await stop.wait()
+    finally:
+        server.stop()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
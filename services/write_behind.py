@@ -0,0 +1,163 @@
+import asyncio
+
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.collection import Collection
+from pymongo.errors import AutoReconnect, BulkWriteError, PyMongoError
+
+from cfg.config import settings
+from utils.logs import get_logger
+from utils.metrics import registry
+
+log = get_logger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Buffers Mongo write operations produced by the update handlers and
+    flushes them with bulk_write from a background task.
+    A batch is flushed when it reaches `batch_size` operations or when
+    `linger` seconds passed since its first operation, whichever comes first.
+    The queue is bounded: `put` waits while it is full (backpressure).
+    Checkpoint operations are written after the other writes of their
+    batch and only when all of those succeeded.
+    """
+
+    FLUSH_RETRIES = 3
+
+    def __init__(self, batch_size: int, linger: float, max_size: int) -> None:
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """ Start the background flusher on the running event loop """
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        log.info(
+            "Write-behind queue started (batch size: %s, linger: %ss, max size: %s)",
+            self.batch_size, self.linger, self.max_size
+        )
+
+    async def stop(self) -> None:
+        """ Flush everything that is still queued and stop the flusher """
+        if not self.is_running:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        self._queue = None
+        log.info("Write-behind queue stopped")
+
+    async def put(self, collection: Collection, operation, checkpoint: bool = False) -> None:
+        """
+        Enqueue a pymongo write operation (InsertOne, UpdateOne, ...).
+        `checkpoint` marks an operation that records the writes queued
+        before it as done, e.g. the processed update_id.
+        When the flusher is not running (e.g. in Celery tasks) the operation
+        is written right away in a worker thread.
+        """
+        if not self.is_running or self._stopping:
+            await self._bulk_write(collection, [operation])
+            return
+
+        await self._queue.put((collection, operation, checkpoint))
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._queue.empty():
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            batch: List[Tuple[Collection, object, bool]] = []
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                remaining = deadline - loop.time()
+                if len(batch) >= self.batch_size or remaining <= 0 or self._stopping:
+                    break
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Collection, object, bool]]) -> None:
+        grouped: Dict[str, Tuple[Collection, List]] = {}
+        checkpoints: Dict[str, Tuple[Collection, List]] = {}
+        for collection, operation, checkpoint in batch:
+            groups = checkpoints if checkpoint else grouped
+            groups.setdefault(collection.full_name, (collection, []))[1].append(operation)
+
+        succeeded = True
+        for collection, operations in grouped.values():
+            succeeded = await self._bulk_write(collection, operations) and succeeded
+
+        if not succeeded:
+            if checkpoints:
+                log.warning("Write-behind: checkpoints are not advanced, writes of the batch failed")
+            return
+
+        for collection, operations in checkpoints.values():
+            await self._bulk_write(collection, operations)
+
+    async def _bulk_write(self, collection: Collection, operations: List) -> bool:
+        """ Returns whether all the writes were applied (or were duplicates) """
+        for attempt in range(1, self.FLUSH_RETRIES + 1):
+            try:
+                await asyncio.to_thread(collection.bulk_write, operations, ordered=False)
+                return True
+            except BulkWriteError as e:
+                # Duplicate keys are expected: guarded upserts of stale data
+                errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                if errors:
+                    log.warning(
+                        "Write-behind: %s of %s writes to %s failed", len(errors), len(operations), collection.name
+                    )
+                return not errors
+            except AutoReconnect as e:
+                log.warning("Write-behind: connection error on %s (attempt %s): %s", collection.name, attempt, e)
+                await asyncio.sleep(0.5 * 2 ** attempt)
+            except PyMongoError as e:
+                log.error("Write-behind: error writing to %s: %s", collection.name, e)
+                return False
+
+        log.error("Write-behind: dropped %s writes to %s", len(operations), collection.name)
+        return False
+
+
+write_behind = WriteBehindQueue(
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    linger=settings.WRITE_BEHIND_LINGER_MS / 1000,
+    max_size=settings.WRITE_BEHIND_MAX_QUEUE,
+)
+registry.gauge("write_behind_queue_depth", "Writes waiting to be flushed", write_behind.qsize)
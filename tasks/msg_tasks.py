@@ -1,143 +1,130 @@
-import asyncio
+from typing import Dict, List
+from datetime import datetime, timedelta, timezone
 
-from typing import List
+from celery import chord
 
-from zoneinfo import ZoneInfo
-from datetime import datetime, timedelta, time
+from cfg.celery_conf import celery_app
+from cfg.config import settings
+from utils.logs import get_logger
+from utils.metrics import checker_duration, timed
+from utils.runner import async_runner
 
-from telegram.error import TimedOut
+from services.locks import acquire_lock, release_lock
+
+log = get_logger(__name__)
+
+# Services and repositories are imported inside the tasks: beat and the
+# worker's startup only need the task names, not Mongo or the Telegram stack.
 
-from cfg.celery_conf import celery_app
-from utils.logs import log
 
-from services.bot import Bot
-from schemas.igonred_users import IgnoredUserSchema
-from repositories.mongodb import (
-    ChatRepository, MessageRepository,
-    UserRepository, IgnoredUserRepository
-)
+CHECK_MSG_LOCK = "check_msg"
 
 
 @celery_app.task()
 def check_msg():
+    from services.rules import is_day_off, is_work_time
+
     is_working_time: bool = is_work_time()
     if not is_working_time:
         log.info("It is not a working time, skipping...")
         return
 
-    time_delta = datetime.now() - timedelta(minutes=14)
-    log.info(f"time_delta, {time_delta}")
-    
-    if datetime.today().weekday() == 5:
+    if is_day_off():
         log.info("Today is Saturday, no need to check for advertisers")
         return
 
-    last_messages_today = MessageRepository.get_last_message_from_all_group_chats_for_today()
-    moderators = UserRepository.get_all_moderators()
-    moderators_usernames = [moderator.username for moderator in moderators]
-
-    moderators_group_chat = ChatRepository.get_admins_chat_id()
-    ignored_users_list: List[IgnoredUserSchema] = IgnoredUserRepository.get_list_ignored_users()
-    ign_usr_list = ignored_users_to_list(ignored_users_list)
-
-    advertisers = []
-    messages_to_ignore = [
-        "thanks", "thank", "no", "moment", "atm", "noted",
-        "pushing", "us", "thank you", "need", "push"
-    ]
-    for last_message in last_messages_today:
-        first_name = last_message.first_name if last_message.first_name else ''
-        last_name = last_message.last_name if last_message.last_name else ''
-        
-        if last_message.name == "Deals confirmations - Test":
-            log.info("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-            log.info(last_message.created_at < time_delta)
-            log.info(last_message.username not in moderators_usernames)
-            log.info(("stark" not in first_name.lower()) and (last_name.lower() != "stark"))
-            log.info(last_message.message.lower() not in messages_to_ignore)
-            log.info(last_message.username not in ign_usr_list)
-
-        if (
-                # Check if message was created 15 minute ago
-                (last_message.created_at < time_delta)
-                # Check if username of the message owner is not in moderator list
-                and (
-                    last_message.username not in moderators_usernames)
-                # Check if message is not contains a "stark" in first or last name
-                and (
-                    ("stark" not in first_name.lower())
-                    and
-                    (last_name.lower() != "stark")
-                )
-                # Check if last message is not in ignored list
-                and (
-                    last_message.message.lower() not in messages_to_ignore
-                )
-                # Check if username of the message owner is not in ignored list
-                and (
-                    last_message.username not in ign_usr_list
-                )
-        ):
-            if not any(ad['name'] == last_message.name for ad in advertisers):
-                advertisers.append({
-                    "chat_id": last_message.chat_id,
-                    "username": last_message.username,
-                    "name": last_message.name,
-                })
-
-    if advertisers:
-        notification_message = (
-            "These are the advertisers that are waiting for a reply:\n" +
-            "\n".join(f"- {adv['name']} - @{adv['username']}" for adv in advertisers)
-        )
-        log.info("----------------------------------------------")
-        log.info(f"Notification message: {notification_message}")
-        log.info("----------------------------------------------")
+    # Overlapping beat ticks must not run the check twice
+    lock_token = acquire_lock(CHECK_MSG_LOCK, settings.CHECK_MSG_LOCK_SECONDS)
+    if not lock_token:
+        log.info("Previous check is still running, skipping...")
+        return
 
-        loop = asyncio.get_event_loop()
-        if loop.is_closed():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+    shards = settings.CHECK_MSG_SHARDS
+    chord(
+        check_msg_shard.s(shard, shards) for shard in range(shards)
+    )(notify_advertisers.s(lock_token))
 
-        loop.run_until_complete(send_msg_to_moderators(moderators_group_chat, notification_message))
 
+@celery_app.task()
+@timed(checker_duration, "check_msg_shard")
+def check_msg_shard(shard: int, shards: int) -> List[Dict]:
+    """ Advertisers of one shard waiting for a reply, with their due alert tier """
+    from repositories.mongodb import MessageRepository
+    from services.notifications import claim_alerts
+    from services.reference_data import reference_data
+    from services.rules import find_waiting_advertisers
+
+    time_delta = datetime.now() - timedelta(minutes=14)
+
+    last_messages_today = MessageRepository.get_last_messages_for_today(shard, shards, time_delta)
+    ref = reference_data.get()
+
+    advertisers = find_waiting_advertisers(last_messages_today, ref, time_delta)
+    alerts = claim_alerts(advertisers, last_messages_today, datetime.now(timezone.utc))
+
+    log.info(
+        "Shard %s/%s: %s advertisers are waiting, %s alerts are due",
+        shard, shards, len(advertisers), len(alerts)
+    )
+    return alerts
+
+
+@celery_app.task()
+@timed(checker_duration, "notify_advertisers")
+def notify_advertisers(shard_results: List[List[Dict]], lock_token: str) -> None:
+    """ Chord callback, sends one notification for all shards """
+    from services.reference_data import reference_data
 
-async def send_msg_to_moderators(
-        moderators_group_chat: int,
-        notification_message: str
-) -> None:
     try:
-        await Bot.send_message_to_chat(
-            moderators_group_chat, notification_message
-        )
-    except TimedOut as e:
-        log.info(f"Error: {e}")
-        log.info(f"Retrying ...: {e}")
-        await Bot.send_message_to_chat(
-            moderators_group_chat, notification_message
+        advertisers = {}
+        for shard_advertisers in shard_results:
+            for adv in shard_advertisers:
+                advertisers.setdefault(adv["name"], adv)
+
+        if not advertisers:
+            return
+
+        log.info("Notifying moderators about %s advertisers", len(advertisers))
+
+        async_runner.run(
+            send_msg_to_moderators(reference_data.get().admins_chat_id, list(advertisers.values())),
+            timeout=settings.CHECK_MSG_NOTIFY_TIMEOUT
         )
-    except BaseException as e:
-        log.info(f"Base Exception Error: {e}")
+    finally:
+        release_lock(CHECK_MSG_LOCK, lock_token)
 
 
-def ignored_users_to_list(
-        ignored_users: List[IgnoredUserSchema]
-) -> List:
-    ignored_list: List = [ign_usr.username for ign_usr in ignored_users]
-    return ignored_list
+@celery_app.task()
+def reconcile_hot_state() -> None:
+    """ Rebuild the Redis hot state of the "redis" strategy from chat_state """
+    if settings.LAST_MESSAGES_STRATEGY != "redis":
+        return
 
+    from repositories.hot_state import HotStateRepository
+    from repositories.mongodb import ChatStateRepository, UserRepository
 
-def is_work_time() -> bool:
-    utc_date_time = datetime.now()
+    processed = HotStateRepository.reconcile(
+        ChatStateRepository.get_group_states(),
+        UserRepository.get_moderator_usernames()
+    )
+    log.info("Hot state reconciled for %s chats", processed)
 
-    gmt_plus_3 = ZoneInfo('Etc/GMT-3')  # 'Etc/GMT-3' corresponds to GMT+3
-    local_date_time = utc_date_time.astimezone(gmt_plus_3)
-    current_time = local_date_time.time()
 
-    start_time = time(22, 0)  # 22:00 PM
-    end_time = time(8, 0)  # 08:00 AM
+async def send_msg_to_moderators(
+        moderators_group_chat: int,
+        advertisers: List[Dict]
+) -> None:
+    from services.notifications import notify_moderators
+    from services.outbound import outbound
+
+    async_runner.on_shutdown(outbound.stop)  # closes the HTTP pool when the worker process exits
 
-    # Check if current time is within the range
-    if start_time <= current_time or current_time <= end_time:
-        return False
-    return True
+    # Retries, backoff and flood limits are handled by the outbound sender
+    try:
+        await notify_moderators(moderators_group_chat, advertisers)
+    except Exception as e:  # not CancelledError, the runner cancels it on timeout
+        log.info("Base Exception Error: %s", e)
+    log.info(
+        "Outbound: queue depth %s, sent %s, failed %s, max latency %.2fs",
+        outbound.queue_depth, outbound.sent, outbound.failed, outbound.latency_max
+    )
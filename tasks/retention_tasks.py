@@ -0,0 +1,12 @@
+from cfg.celery_conf import celery_app
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+@celery_app.task()
+def rollup_messages():
+    from services.retention import rollup_finished_days
+
+    days = rollup_finished_days()
+    log.info("Rolled up messages of %s days", days)
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+from cfg.config import settings
+from schemas.records import MessageRecord
+from schemas.rules import NotificationRuleSchema
+from services.rules import compile_rules, default_rules
+
+
+DEFAULT_PHRASES = ["thanks", "thank", "no", "moment", "atm", "noted", "pushing", "us", "thank you", "need", "push"]
+
+
+def legacy_is_waiting(message: str, first_name: str, last_name: str) -> bool:
+    """ The filter check_msg applied before the rules engine """
+    return (
+        "stark" not in first_name.lower()
+        and last_name.lower() != "stark"
+        and message.lower() not in DEFAULT_PHRASES
+    )
+
+
+@pytest.fixture
+def rules(monkeypatch):
+    monkeypatch.setattr(settings, "IGNORE_PHRASES", DEFAULT_PHRASES)
+    monkeypatch.setattr(settings, "IGNORE_FIRST_NAME_PATTERNS", ["stark"])
+    monkeypatch.setattr(settings, "IGNORE_LAST_NAME_PATTERNS", ["^stark$"])
+    return compile_rules(default_rules())
+
+
+def message(text: str, first_name: str = "", last_name: str = "") -> MessageRecord:
+    return MessageRecord(
+        chat_id=-1, name="Deals", message=text, username="advertiser",
+        created_at=datetime(2024, 1, 1), first_name=first_name, last_name=last_name
+    )
+
+
+@pytest.mark.parametrize("text", ["Hello, any update?", "Thanks", "thank you", "NOTED", "no", "not now", ""])
+@pytest.mark.parametrize("first_name, last_name", [
+    ("Bob", "Smith"), ("Tony Stark", ""), ("Starkey", "Smith"),
+    ("Bob", "Stark"), ("Bob", "Starkey"), ("", ""),
+])
+def test_default_rules_match_legacy_filter(rules, text, first_name, last_name):
+    waiting = rules.is_waiting_for_reply(message(text, first_name, last_name), frozenset(), frozenset())
+    assert waiting == legacy_is_waiting(text, first_name, last_name)
+
+
+def test_empty_values_are_skipped():
+    rules = compile_rules([
+        NotificationRuleSchema(type="ignore_name", field="first_name", value=""),
+        NotificationRuleSchema(type="ignore_phrase", value="  "),
+    ])
+    assert rules.name_patterns["first_name"] is None
+    assert rules.is_waiting_for_reply(message("", "Bob"), frozenset(), frozenset())
+
+
+def test_pattern_invalid_once_combined_is_skipped():
+    rules = compile_rules([
+        NotificationRuleSchema(type="ignore_name", field="first_name", value="stark"),
+        NotificationRuleSchema(type="ignore_name", field="first_name", value="(?i)admin"),
+    ])
+    assert not rules.is_waiting_for_reply(message("hi", "Tony Stark"), frozenset(), frozenset())
+    assert rules.is_waiting_for_reply(message("hi", "Admin"), frozenset(), frozenset())
@@ -0,0 +1,271 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, value in self._values.items():
+                lines.append(f"{self.name}{format_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            counts, total = self._values.setdefault(
+                label_values, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    bucket_labels = format_labels(self.labels, values, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                cumulative += counts[-1]
+                bucket_labels = format_labels(self.labels, values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {total[0]}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """ Value read from a callback when the metrics are scraped """
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self) -> List[str]:
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labels, **kwargs))
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+        self._metrics[name] = Gauge(name, documentation, func)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds", "Time spent in update and command handlers", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handlers that raised", ("handler",)
+)
+update_lag = registry.histogram(
+    "bot_update_lag_seconds", "Delay between a message being sent and handled",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+)
+mongo_duration = registry.histogram(
+    "mongo_command_duration_seconds", "Mongo command round-trip time", ("command",)
+)
+mongo_failures = registry.counter(
+    "mongo_command_failures_total", "Failed Mongo commands", ("command",)
+)
+telegram_send_duration = registry.histogram(
+    "telegram_send_duration_seconds", "Time from queueing a message until it is sent"
+)
+telegram_sends = registry.counter(
+    "telegram_sends_total", "Outbound Telegram messages by result", ("result",)
+)
+checker_duration = registry.histogram(
+    "checker_duration_seconds", "Duration of the message check tasks", ("task",)
+)
+
+
+def timed(histogram: Histogram, *label_values: str, errors: Optional[Counter] = None):
+    """ Decorator recording the duration of sync or async functions """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    if errors is not None:
+                        errors.inc(*label_values)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started, *label_values)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                if errors is not None:
+                    errors.inc(*label_values)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, *label_values)
+        return wrapper
+    return decorator
+
+
+def instrument_handler(callback, name: str):
+    """
+    Wrap a python-telegram-bot callback with duration and error metrics.
+    For incoming messages the lag since Telegram received them is recorded too.
+    """
+    timed_callback = timed(handler_duration, name, errors=handler_errors)(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        message = getattr(update, "message", None)
+        if message is not None and message.date is not None:
+            update_lag.observe(max(0.0, time.time() - message.date.timestamp()))
+        return await timed_callback(update, context)
+
+    return wrapper
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """ Times every command sent by the MongoClient it is attached to """
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        mongo_duration.observe(event.duration_micros / 1_000_000, event.command_name)
+
+    def failed(self, event) -> None:
+        mongo_duration.observe(event.duration_micros / 1_000_000, event.command_name)
+        mongo_failures.inc(event.command_name)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass  # scrapes are not worth a log line
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int) -> None:
+    """ Serve /metrics in Prometheus text format from a daemon thread """
+    global _server
+    if _server is not None or not port:
+        return
+
+    try:
+        _server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        log.info("Metrics server could not start on port %s: %s", port, e)
+        return
+
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+    log.info("Metrics are served on :%s/metrics", port)
+
+
+def _forget_server_after_fork() -> None:
+    # The serving thread is not copied by fork(), a child starts its own server
+    global _server
+    _server = None
+
+
+os.register_at_fork(after_in_child=_forget_server_after_fork)
@@ -0,0 +1,85 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+from typing import Awaitable, Callable, List, Optional
+
+from utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class AsyncRunner:
+    """
+    One event loop per process, running in a daemon thread, for the async
+    I/O of Celery tasks (Telegram sends). Tasks of any worker thread submit
+    their coroutines to it, so clients bound to the loop, like the pooled
+    HTTP client of the outbound sender, live as long as the process.
+    A forked child starts its own loop on first use.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._shutdown_callbacks: List[Callable[[], Awaitable]] = []
+        os.register_at_fork(after_in_child=self._reset)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """
+        Run the coroutine on the process loop and wait for its result.
+        After `timeout` seconds the coroutine is cancelled and
+        concurrent.futures.TimeoutError is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def on_shutdown(self, callback: Callable[[], Awaitable]) -> None:
+        """ Coroutine function awaited on the loop by `stop`, e.g. to close clients """
+        if callback not in self._shutdown_callbacks:
+            self._shutdown_callbacks.append(callback)
+
+    def stop(self, timeout: float = 10) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+
+            for callback in self._shutdown_callbacks:
+                try:
+                    asyncio.run_coroutine_threadsafe(callback(), loop).result(timeout)
+                except Exception as e:
+                    log.warning("Async runner shutdown callback failed: %s", e)
+
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop
+        if loop is not None:
+            return loop
+
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, daemon=True, name="async-runner")
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def _reset(self) -> None:
+        # The loop thread does not survive fork()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+async_runner = AsyncRunner()